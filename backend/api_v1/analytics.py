@@ -0,0 +1,220 @@
+from calendar import monthrange
+from collections import Counter
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, F, Q, Sum, When
+from django.db.models.functions import Coalesce, Trunc
+
+from users.models import (CONDITION, SPECIAL_CONDITION, TRIAL_PERIOD,
+                          UserMonthlyExpense, UserService)
+
+from .utils import get_condition_kind, get_days, get_user_conditions
+
+DAY_BUCKET = 'day'
+WEEK_BUCKET = 'week'
+MONTH_BUCKET = 'month'
+BUCKETS = (DAY_BUCKET, WEEK_BUCKET, MONTH_BUCKET)
+
+
+def next_month(month):
+    return month + timedelta(days=monthrange(month.year, month.month)[1])
+
+
+def get_buckets(start_date, end_date, bucket):
+    if bucket == MONTH_BUCKET:
+        current = start_date.replace(day=1)
+    else:
+        current = start_date
+        if bucket == WEEK_BUCKET:
+            current -= timedelta(days=start_date.weekday())
+    while current <= end_date:
+        yield current
+        if bucket == MONTH_BUCKET:
+            current = next_month(current)
+        else:
+            current += timedelta(days=7 if bucket == WEEK_BUCKET else 1)
+
+
+def split_period(start_date, end_date):
+    first_month = start_date.replace(day=1)
+    if start_date.day > 1:
+        first_month = next_month(first_month)
+    last_day = end_date
+    if end_date.day < monthrange(end_date.year, end_date.month)[1]:
+        last_day = end_date.replace(day=1) - timedelta(days=1)
+    if first_month > last_day:
+        return None, [(start_date, end_date)]
+    partial = []
+    if start_date < first_month:
+        partial.append((start_date, first_month - timedelta(days=1)))
+    if end_date > last_day:
+        partial.append((last_day + timedelta(days=1), end_date))
+    return (first_month, last_day.replace(day=1)), partial
+
+
+def get_rollup_queryset(user, months):
+    return UserMonthlyExpense.objects.filter(user=user, month__range=months)
+
+
+def get_partial_queryset(user, partial):
+    return UserService.objects.filter(user=user).filter(reduce(or_, (
+        Q(start_date__range=period) for period in partial
+    )))
+
+
+def get_expenses(user, start_date, end_date):
+    months, partial = split_period(start_date, end_date)
+    querysets = []
+    if months:
+        querysets.append(get_rollup_queryset(user, months))
+    if partial:
+        querysets.append(get_partial_queryset(user, partial))
+    return sum(
+        queryset.aggregate(
+            expenses=Coalesce(Sum('expense'), 0)
+        )['expenses']
+        for queryset in querysets
+    )
+
+
+def get_expenses_by_category(user, start_date, end_date):
+    months, partial = split_period(start_date, end_date)
+    expenses = Counter()
+    if months:
+        expenses.update(dict(get_rollup_queryset(user, months).values_list(
+            'category__name'
+        ).annotate(Sum('expense'))))
+    if partial:
+        expenses.update(dict(get_partial_queryset(user, partial).values_list(
+            'service__category__name'
+        ).annotate(Sum('expense'))))
+    return [
+        {'name': name, 'expenses': expenses[name]}
+        for name in sorted(expenses)
+    ]
+
+
+def get_expenses_series(user, start_date, end_date, bucket):
+    expenses = Counter()
+    if bucket == MONTH_BUCKET:
+        months, partial = split_period(start_date, end_date)
+        if months:
+            expenses.update(dict(get_rollup_queryset(user, months).values_list(
+                'month'
+            ).annotate(Sum('expense')).order_by()))
+    else:
+        partial = [(start_date, end_date)]
+    if partial:
+        expenses.update(dict(get_partial_queryset(user, partial).values_list(
+            Trunc('start_date', bucket)
+        ).annotate(Sum('expense')).order_by()))
+    dates = list(get_buckets(start_date, end_date, bucket))
+    return {
+        'dates': dates,
+        'expenses': [expenses[bucket_date] for bucket_date in dates]
+    }
+
+
+def get_next_condition(tariff, kind):
+    if kind == TRIAL_PERIOD and hasattr(tariff, 'tariff_special_condition'):
+        return SPECIAL_CONDITION, tariff.tariff_special_condition
+    return CONDITION, getattr(tariff, 'tariff_condition', None)
+
+
+def get_charges(tariff, kind, charge_date, last_day):
+    while charge_date <= last_day:
+        kind, condition = get_next_condition(tariff, kind)
+        if condition is None:
+            return
+        yield charge_date, kind, condition
+        charge_date += timedelta(days=get_days(condition) + 1)
+
+
+def get_expenses_forecast(user, months):
+    today = date.today()
+    month_dates = [today.replace(day=1)]
+    while len(month_dates) < months:
+        month_dates.append(next_month(month_dates[-1]))
+    last_day = next_month(month_dates[-1]) - timedelta(days=1)
+    subscriptions = list(UserService.objects.filter(
+        user=user,
+        is_active=True,
+        auto_pay=True,
+        end_date__lt=last_day
+    ).select_related(
+        'tariff__tariff_condition',
+        'tariff__tariff_special_condition'
+    ))
+    conditions = None
+    if not all(subscription.condition for subscription in subscriptions):
+        conditions = get_user_conditions(subscriptions)
+    expenses = [0] * len(month_dates)
+    for subscription in subscriptions:
+        kind = (
+            subscription.condition
+            or get_condition_kind(subscription, conditions)
+        )
+        for charge_date, kind, condition in get_charges(
+            subscription.tariff,
+            kind,
+            max(subscription.end_date + timedelta(days=1), today),
+            last_day
+        ):
+            expenses[
+                (charge_date.year - today.year) * 12
+                + charge_date.month - today.month
+            ] += condition.price
+    return {'months': month_dates, 'expenses': expenses}
+
+
+def get_renewal_filter():
+    today = date.today()
+    return Q(
+        is_active=True,
+        auto_pay=True,
+        end_date__gt=today,
+        end_date__lte=next_month(today.replace(day=1)) - timedelta(days=1)
+    )
+
+
+def get_renewal_price():
+    return Case(
+        When(
+            Q(condition=TRIAL_PERIOD),
+            tariff__tariff_special_condition__isnull=False,
+            then=F('tariff__tariff_special_condition__price')
+        ),
+        default=F('tariff__tariff_condition__price')
+    )
+
+
+def get_summary(user, start_date, end_date):
+    period = Q(start_date__range=(start_date, end_date))
+    renewals = get_renewal_filter()
+    categories = UserService.objects.filter(user=user).filter(
+        period | renewals
+    ).values(
+        name=F('service__category__name')
+    ).annotate(
+        expenses=Sum('expense', filter=period),
+        cashback=Sum('cashback', filter=period),
+        future_expenses=Sum(get_renewal_price(), filter=renewals)
+    ).order_by('name')
+    summary = {
+        'expenses': 0,
+        'expenses_by_category': [],
+        'future_expenses': 0,
+        'cashback': 0
+    }
+    for category in categories:
+        summary['future_expenses'] += category['future_expenses'] or 0
+        if category['expenses'] is None:
+            continue
+        summary['expenses'] += category['expenses']
+        summary['cashback'] += category['cashback']
+        summary['expenses_by_category'].append(
+            {'name': category['name'], 'expenses': category['expenses']}
+        )
+    return summary
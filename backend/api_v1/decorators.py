@@ -0,0 +1,45 @@
+from datetime import date
+from functools import wraps
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from services.cache import catalog_cache
+
+
+def get_user_etag(user):
+    return f'"{user.pk}-{user.data_version}-{date.today():%Y%m%d}"'
+
+
+def user_data_etag(func):
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        etag = get_user_etag(request.user)
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in etags or '*' in etags:
+            if hasattr(self, 'validate_query_params'):
+                self.validate_query_params()
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+        response = func(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+    return wrapper
+
+
+def catalog_cached(func):
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.build_absolute_uri()
+        data = catalog_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = func(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            catalog_cache.set(key, response.data)
+        return response
+    return wrapper
@@ -7,7 +7,25 @@ class PaymentError(APIException):
     default_code = 'payment_error'
 
 
+class PaymentUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Банк не подтвердил платеж, повторите запрос позже'
+    default_code = 'payment_unavailable'
+
+
+class SubscriptionExists(APIException):
+    status_code = 400
+    default_detail = 'Подписка на этот тариф уже оформлена'
+    default_code = 'subscription_exists'
+
+
 class CashbackError(APIException):
     status_code = 400
     default_detail = 'Ошибка зачисления кэшбека'
     default_code = 'cashback_error'
+
+
+class IdempotencyKeyConflict(APIException):
+    status_code = 409
+    default_detail = 'Ключ идемпотентности уже использован в другом заказе'
+    default_code = 'idempotency_conflict'
@@ -1,6 +1,12 @@
 from rest_framework.response import Response
 
 
+class FilterQueryParamsMixin:
+
+    def validate_query_params(self):
+        self.filter_queryset(self.get_queryset())
+
+
 class UpdateModelMixin:
 
     def perform_update(self, serializer):
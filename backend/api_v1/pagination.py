@@ -1,5 +1,13 @@
+from base64 import b64decode, b64encode
+from datetime import date
+from urllib import parse
+from uuid import UUID
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class ServicePagination(LimitOffsetPagination):
@@ -14,3 +22,80 @@ class ServicePagination(LimitOffsetPagination):
             'next': self.get_next_link()
             }
         )
+
+
+class UserServicePagination(ServicePagination):
+    cursor_query_param = 'cursor'
+    ordering = ('-start_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = queryset.order_by(*self.ordering)
+        self.keyset = self.offset_query_param not in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        reverse, position = self.decode_cursor(request)
+        if position is not None:
+            start_date, pk = position
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                **{f'start_date__{lookup}e': start_date}
+            ).filter(
+                Q(**{f'start_date__{lookup}': start_date})
+                | Q(**{f'id__{lookup}': pk})
+            )
+            if reverse:
+                queryset = queryset.reverse()
+        self.page = list(queryset[:self.limit + 1])
+        has_more = len(self.page) > self.limit
+        self.page = self.page[:self.limit]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            tokens = parse.parse_qs(
+                b64decode(encoded.encode('ascii')).decode('ascii')
+            )
+            return bool(int(tokens['r'][0])), (
+                date.fromisoformat(tokens['d'][0]),
+                UUID(tokens['i'][0])
+            )
+        except (KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, obj):
+        querystring = parse.urlencode({
+            'r': int(reverse),
+            'd': obj.start_date.isoformat(),
+            'i': obj.pk
+        })
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(querystring.encode('ascii')).decode('ascii')
+        )
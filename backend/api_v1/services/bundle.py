@@ -0,0 +1,69 @@
+import gzip
+import json
+from hashlib import sha256
+from urllib.parse import urljoin
+
+from django.db.models import Prefetch
+from rest_framework.utils.encoders import JSONEncoder
+
+from services.cache import catalog_cache
+from services.models import CatalogBundle, Service, Tariff
+from users.utils import get_full_url
+
+from .serializers import ServiceBundleSerializer
+
+BUNDLE_CACHE_KEY = 'bundle'
+
+
+class CatalogRequest:
+
+    def build_absolute_uri(self, location):
+        return urljoin(get_full_url(), location.lstrip('/'))
+
+
+def build_catalog_bundle():
+    services = Service.objects.prefetch_related(
+        Prefetch(
+            'tariffs',
+            queryset=Tariff.objects.select_related(
+                'tariff_condition',
+                'tariff_special_condition',
+                'tariff_trial_period'
+            )
+        ),
+        'category_images__service_category_images'
+    ).order_by('name')
+    data = ServiceBundleSerializer(
+        services,
+        many=True,
+        context={'request': CatalogRequest()}
+    ).data
+    version = sha256(
+        json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()
+    ).hexdigest()
+    content = gzip.compress(
+        json.dumps(
+            {'version': version, 'services': data},
+            cls=JSONEncoder,
+            ensure_ascii=False
+        ).encode()
+    )
+    CatalogBundle.objects.update_or_create(
+        pk=1,
+        defaults={'version': version, 'content': content}
+    )
+    return version, content
+
+
+def get_catalog_bundle():
+    bundle = catalog_cache.get(BUNDLE_CACHE_KEY, local=False)
+    if bundle is None:
+        bundle = CatalogBundle.objects.filter(pk=1).values_list(
+            'version',
+            'content'
+        ).first()
+        if bundle is None:
+            bundle = build_catalog_bundle()
+        bundle = (bundle[0], bytes(bundle[1]))
+        catalog_cache.set(BUNDLE_CACHE_KEY, bundle, local=False)
+    return bundle
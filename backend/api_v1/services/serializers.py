@@ -1,3 +1,4 @@
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 
 from services.models import (CategoryImage, Service, ServiceCategoryImage,
@@ -100,28 +101,32 @@ class TariffRetrieveSerializer(serializers.ModelSerializer):
             'trial_period'
         )
 
+    def get_related_condition(self, obj, name, serializer_class):
+        try:
+            return serializer_class(getattr(obj, name)).data
+        except ObjectDoesNotExist:
+            return {}
+
     def get_condition(self, obj):
-        return TariffConditionSerializer(
-            obj.tariff_condition
-        ).data
+        return self.get_related_condition(
+            obj,
+            'tariff_condition',
+            TariffConditionSerializer
+        )
 
     def get_special_condition(self, obj):
-        if TariffSpecialCondition.objects.filter(
-            tariff=obj
-        ).exists():
-            return TariffSpecialConditionSerializer(
-                obj.tariff_special_condition
-            ).data
-        return {}
+        return self.get_related_condition(
+            obj,
+            'tariff_special_condition',
+            TariffSpecialConditionSerializer
+        )
 
     def get_trial_period(self, obj):
-        if TariffTrialPeriod.objects.filter(
-            tariff=obj
-        ).exists():
-            return TariffTrialPeriodSerializer(
-                obj.tariff_trial_period
-            ).data
-        return {}
+        return self.get_related_condition(
+            obj,
+            'tariff_trial_period',
+            TariffTrialPeriodSerializer
+        )
 
 
 class TariffConditionSerializer(serializers.ModelSerializer):
@@ -149,3 +154,27 @@ class TariffTrialPeriodSerializer(TariffConditionSerializer):
 
     class Meta(TariffConditionSerializer.Meta):
         model = TariffTrialPeriod
+
+
+class CategoryImageBundleSerializer(CategoryImageSerializer):
+    images = ServiceCategoryImageSerializer(
+        source='service_category_images',
+        many=True
+    )
+
+    class Meta(CategoryImageSerializer.Meta):
+        fields = CategoryImageSerializer.Meta.fields + ('images',)
+
+
+class ServiceBundleSerializer(ServiceRetrieveSerializer):
+    tariffs = TariffRetrieveSerializer(many=True)
+    image_categories = CategoryImageBundleSerializer(
+        source='category_images',
+        many=True
+    )
+
+    class Meta(ServiceRetrieveSerializer.Meta):
+        fields = ServiceRetrieveSerializer.Meta.fields + (
+            'tariffs',
+            'image_categories'
+        )
@@ -1,11 +1,19 @@
-from django.db.models import Count
+import gzip
+
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.response import Response
 
-from services.models import Service
+from services.models import Service, Tariff
+from services.search import search_services, service_prefix_index
 
+from ..decorators import catalog_cached
 from ..pagination import ServicePagination
 from ..response_shema import (
     response_schema_dict_image_categories_list,
@@ -14,6 +22,7 @@ from ..response_shema import (
     response_schema_dict_service_image_categories_list,
     response_schema_dict_services_list, response_schema_dict_tariff_detail,
     response_schema_dict_tariffs_list)
+from .bundle import get_catalog_bundle
 from .serializers import (CategoryImageSerializer, PopularServiceSerialiser,
                           ServiceCategoryImageSerializer,
                           ServiceListSerializer, ServiceRetrieveSerializer,
@@ -25,7 +34,12 @@ class ServiceParentViewSet(ListModelMixin, viewsets.GenericViewSet):
 
 
 class SevicesViewSet(RetrieveModelMixin, ServiceParentViewSet):
-    queryset = Service.objects.all()
+
+    def get_queryset(self):
+        search = self.request.query_params.get('search')
+        if self.action == 'list' and search:
+            return search_services(search)
+        return Service.objects.all()
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -34,19 +48,76 @@ class SevicesViewSet(RetrieveModelMixin, ServiceParentViewSet):
 
     @swagger_auto_schema(
         operation_description=(
-            'Список сервисов '
+            'Список сервисов. При использовании параметра search '
+            'возвращает сервисы, в названии, полном названии или кратком '
+            'описании которых есть слова, начинающиеся с переданных.'
         ),
+        manual_parameters=[
+            openapi.Parameter(
+                'search',
+                openapi.IN_QUERY,
+                description='Строка поиска',
+                type=openapi.TYPE_STRING
+            )
+        ],
         responses=response_schema_dict_services_list
     )
+    @catalog_cached
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description=(
+            'Подсказки для поиска: до 10 сервисов, название которых '
+            'или слово в названии начинается со строки search.'
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'search',
+                openapi.IN_QUERY,
+                description='Начало названия сервиса',
+                type=openapi.TYPE_STRING,
+                required=True
+            )
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'data': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'id': openapi.Schema(
+                                    type=openapi.TYPE_STRING
+                                ),
+                                'name': openapi.Schema(
+                                    type=openapi.TYPE_STRING
+                                )
+                            }
+                        )
+                    )
+                }
+            ),
+            status.HTTP_401_UNAUTHORIZED: 'UNAUTHORIZED'
+        }
+    )
+    @action(detail=False, pagination_class=None)
+    def autocomplete(self, request):
+        return Response({
+            'data': service_prefix_index.search(
+                request.query_params.get('search', '')
+            )
+        })
+
     @swagger_auto_schema(
         operation_description=(
             'Информация о сервисе '
         ),
         responses=response_schema_dict_service_detail
     )
+    @catalog_cached
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
@@ -67,6 +138,7 @@ class CategoryImageViewSet(ServiceParentViewSet):
         ),
         responses=response_schema_dict_image_categories_list
     )
+    @catalog_cached
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -91,6 +163,7 @@ class ServiceCategoryImageViewSet(ServiceParentViewSet):
         ),
         responses=response_schema_dict_service_image_categories_list
     )
+    @catalog_cached
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -99,11 +172,7 @@ class PopularServiceViewSet(ServiceParentViewSet):
     serializer_class = PopularServiceSerialiser
 
     def get_queryset(self):
-        queryset = Service.objects.all(
-        ).annotate(
-            Count('user_services__is_active')
-        ).order_by('-user_services__is_active__count')
-        return queryset
+        return Service.objects.order_by('-subscribers_count', 'id')
 
     @swagger_auto_schema(
         operation_description=(
@@ -119,23 +188,44 @@ class TariffViewSet(RetrieveModelMixin, ServiceParentViewSet):
     serializer_class = TariffListSerializer
 
     def get_queryset(self):
-        service = get_object_or_404(
-            Service,
-            pk=self.kwargs['service_id']
+        if self.action == 'list':
+            service = get_object_or_404(
+                Service,
+                pk=self.kwargs['service_id']
+            )
+            queryset = service.tariffs.all()
+        else:
+            queryset = Tariff.objects.filter(
+                service=self.kwargs['service_id']
+            )
+        return queryset.select_related(
+            'tariff_condition',
+            'tariff_special_condition',
+            'tariff_trial_period'
         )
-        return service.tariffs.all()
 
     def get_serializer_class(self):
-        if self.action == 'list':
+        if (self.action == 'list'
+                and self.request.query_params.get('expand') != 'conditions'):
             return TariffListSerializer
         return TariffRetrieveSerializer
 
     @swagger_auto_schema(
         operation_description=(
-            'Список тарифов сервиса '
+            'Список тарифов сервиса. При использовании параметра '
+            'expand=conditions возвращает тарифы вместе с условиями.'
         ),
+        manual_parameters=[
+            openapi.Parameter(
+                'expand',
+                openapi.IN_QUERY,
+                description='conditions',
+                type=openapi.TYPE_STRING
+            )
+        ],
         responses=response_schema_dict_tariffs_list
     )
+    @catalog_cached
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -145,5 +235,39 @@ class TariffViewSet(RetrieveModelMixin, ServiceParentViewSet):
         ),
         responses=response_schema_dict_tariff_detail
     )
+    @catalog_cached
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
+
+
+class CatalogBundleViewSet(viewsets.ViewSet):
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Весь каталог одним документом: сервисы, тарифы с условиями '
+            'и изображения. Версия каталога передается в заголовке ETag. '
+            'Если версия в заголовке If-None-Match совпадает с текущей, '
+            'возвращается ответ 304.'
+        ),
+        responses={
+            status.HTTP_200_OK: 'OK',
+            status.HTTP_304_NOT_MODIFIED: 'NOT MODIFIED',
+            status.HTTP_401_UNAUTHORIZED: 'UNAUTHORIZED'
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        version, content = get_catalog_bundle()
+        etag = f'"{version}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(content, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                gzip.decompress(content),
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        return response
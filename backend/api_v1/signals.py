@@ -0,0 +1,19 @@
+from django.dispatch import receiver
+from kombu.exceptions import OperationalError
+
+from services.cache import catalog_cache
+from services.signals import catalog_committed
+
+from .tasks import REBUILD_COUNTDOWN, REBUILD_KEY, rebuild_catalog_bundle
+
+
+@receiver(catalog_committed)
+def schedule_catalog_bundle_rebuild(sender, **kwargs):
+    token = catalog_cache.call_redis('incr', REBUILD_KEY)
+    try:
+        rebuild_catalog_bundle.apply_async(
+            (token,),
+            countdown=REBUILD_COUNTDOWN
+        )
+    except OperationalError:
+        rebuild_catalog_bundle(token)
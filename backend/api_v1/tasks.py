@@ -0,0 +1,16 @@
+from backend.celery import app
+from services.cache import catalog_cache
+
+from .services.bundle import BUNDLE_CACHE_KEY, build_catalog_bundle
+
+REBUILD_KEY = 'catalog:rebuild'
+REBUILD_COUNTDOWN = 5
+
+
+@app.task
+def rebuild_catalog_bundle(token=None):
+    if token is not None:
+        latest = catalog_cache.call_redis('get', REBUILD_KEY)
+        if latest is not None and int(latest) != token:
+            return
+    catalog_cache.set(BUNDLE_CACHE_KEY, build_catalog_bundle(), local=False)
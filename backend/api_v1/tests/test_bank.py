@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from rest_framework.test import APITestCase
+
+from bank.models import PAYMENT, Payment
+from bank.serializers import MAX_BATCH_SIZE
+
+User = get_user_model()
+
+
+class BankTest(APITestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{i}@ya.ru',
+                password='testpass'
+            )
+            for i in range(3)
+        ]
+
+    def test_payment_batch(self):
+        items = [
+            {'user': user.email, 'price': 100} for user in self.users
+        ] + [{'user': 'unknown@ya.ru', 'price': 100}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('bank:payment_batch'),
+                {'items': items},
+                format='json'
+            )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            [result['success'] for result in response.json()['results']],
+            [True, True, True, False]
+        )
+
+    def test_cashback_accrual_batch(self):
+        response = self.client.post(
+            reverse('bank:cashback_accrual_batch'),
+            {'items': [{'user': self.users[0].email, 'price': 5}]},
+            format='json'
+        )
+        self.assertEqual(response.json(), {'results': [{
+            'user': self.users[0].email,
+            'success': True,
+            'message': 'Кэшбек начислен'
+        }]})
+        response = self.client.post(
+            reverse('bank:cashback_accrual_batch'),
+            {'items': [
+                {'user': self.users[0].email, 'price': 5}
+            ] * (MAX_BATCH_SIZE + 1)},
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_payment_idempotency(self):
+        item = {'user': self.users[0].email, 'price': 100, 'key': 'renewal:1'}
+        for _ in range(2):
+            response = self.client.post(reverse('bank:payment'), item)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            response = self.client.post(
+                reverse('bank:payment_batch'),
+                {'items': [item, item]},
+                format='json'
+            )
+            self.assertEqual(
+                [result['success'] for result in response.json()['results']],
+                [True, True]
+            )
+        payment = Payment.objects.get()
+        self.assertEqual(
+            (payment.user, payment.kind, payment.price),
+            (self.users[0], PAYMENT, 100)
+        )
+        response = self.client.post(
+            reverse('bank:payment'),
+            {'user': 'unknown@ya.ru', 'price': 100, 'key': 'renewal:2'}
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(Payment.objects.count(), 1)
@@ -1,18 +1,45 @@
+import gzip
+import json
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED
+from rest_framework.status import (HTTP_200_OK, HTTP_304_NOT_MODIFIED,
+                                   HTTP_401_UNAUTHORIZED)
 from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from services.models import (CategoryImage, CategoryService, Service,
-                             ServiceCategoryImage, Tariff, TariffCondition)
+from api_v1.services.bundle import BUNDLE_CACHE_KEY
+from api_v1.tasks import rebuild_catalog_bundle
+from backend.celery import app
+from services.cache import CatalogCache, catalog_cache
+from services.models import (CatalogBundle, CategoryImage, CategoryService,
+                             Service, ServiceCategoryImage, Tariff,
+                             TariffCondition)
+from services.search import service_prefix_index
 
 User = get_user_model()
 
 
+class FakeRedis(dict):
+
+    def set(self, key, value, ex=None):
+        self[key] = value
+
+    def incr(self, key):
+        self[key] = int(self.get(key, 0)) + 1
+        return self[key]
+
+    def publish(self, channel, message):
+        return 0
+
+
 class ServiceTest(APITestCase):
 
     def setUp(self):
+        catalog_cache.clear()
         self.category = CategoryService.objects.create(
             name='Текст'
         )
@@ -114,6 +141,17 @@ class ServiceTest(APITestCase):
         self.assertIn('logo', response['data'][0])
         self.assertIn('cashback', response['data'][0])
         self.assertEqual(len(response['data']), 10)
+        ids = []
+        for offset in range(0, len(self.services), 3):
+            response = self.auth_client.get(
+                url,
+                {'skip': 3, 'top': offset}
+            ).json()
+            ids.extend(item['id'] for item in response['data'])
+        self.assertEqual(
+            sorted(ids),
+            sorted(str(service.id) for service in self.services)
+        )
 
     def test_category_images(self):
         url = reverse('image-categories-list', args=(self.services[0].pk,))
@@ -168,3 +206,151 @@ class ServiceTest(APITestCase):
             response['condition']['price'],
             self.tariff.tariff_condition.price
         )
+
+    def test_catalog_cache(self):
+        url = reverse('services-detail', args=(self.services[0].pk,))
+        self.auth_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(url).json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response['name'], self.services[0].name)
+        name = self.services[0].name
+        self.services[0].name = 'Новое название'
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.services[0].save()
+            response = self.auth_client.get(url).json()
+            self.assertEqual(response['name'], name)
+        response = self.auth_client.get(url).json()
+        self.assertEqual(response['name'], 'Новое название')
+
+    def test_tariffs_detail_queries(self):
+        url = reverse(
+            'tariffs-detail',
+            args=(self.services[0].pk, self.tariff.pk)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(url).json()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response['special_condition'], {})
+        self.assertEqual(response['trial_period'], {})
+
+    def test_tariffs_list_expand(self):
+        url = reverse('tariffs-list', args=(self.services[0].pk,))
+        response = self.auth_client.get(url, {'expand': 'conditions'}).json()
+        self.assertEqual(response['data'][0]['condition']['price'], 200)
+        self.assertEqual(response['data'][0]['special_condition'], {})
+        self.assertEqual(response['data'][0]['trial_period'], {})
+
+    def test_catalog_bundle(self):
+        url = reverse('catalog-bundle-list')
+        response = self.auth_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        bundle = json.loads(gzip.decompress(response.content))
+        etag = response['ETag']
+        self.assertEqual(etag, '"{}"'.format(bundle['version']))
+        self.assertEqual(len(bundle['services']), len(self.services))
+        service = next(
+            service for service in bundle['services']
+            if service['id'] == str(self.services[0].id)
+        )
+        self.assertEqual(service['tariffs'][0]['condition']['price'], 200)
+        self.assertEqual(
+            service['image_categories'][0]['images'][0]['title'],
+            self.service_category_image.title
+        )
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+        self.tariff_condition.price = 300
+        self.tariff_condition.save()
+        rebuild_catalog_bundle()
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        bundle = json.loads(response.content)
+        service = next(
+            service for service in bundle['services']
+            if service['id'] == str(self.services[0].id)
+        )
+        self.assertEqual(service['tariffs'][0]['condition']['price'], 300)
+
+    def test_catalog_bundle_debounce(self):
+        rebuild_catalog_bundle()
+        version = CatalogBundle.objects.get().version
+        self.tariff_condition.price = 300
+        self.tariff_condition.save()
+        with patch.object(catalog_cache, 'call_redis', return_value=b'2'):
+            rebuild_catalog_bundle(1)
+            self.assertEqual(CatalogBundle.objects.get().version, version)
+            rebuild_catalog_bundle(2)
+        self.assertNotEqual(CatalogBundle.objects.get().version, version)
+
+    def test_catalog_bundle_version(self):
+        catalog_cache.reset()
+        self.addCleanup(catalog_cache.reset)
+        with patch.object(
+            CatalogCache,
+            'get_client',
+            return_value=FakeRedis()
+        ), patch.object(CatalogCache, 'start_listener'):
+            rebuild_catalog_bundle()
+            CatalogCache().clear()
+            self.tariff_condition.price = 300
+            self.tariff_condition.save()
+            rebuild_catalog_bundle()
+            bundle = CatalogCache().get(BUNDLE_CACHE_KEY, local=False)
+        self.assertEqual(bundle[0], CatalogBundle.objects.get().version)
+
+    def test_services_search(self):
+        service = self.services[0]
+        service.name = 'Okko'
+        service.full_name = 'Okko: фильмы и сериалы'
+        service.save()
+        url = reverse('services-list')
+        for search in ('okk', 'фильм', 'OKKO сериал'):
+            response = self.auth_client.get(url, {'search': search}).json()
+            self.assertEqual(
+                [item['id'] for item in response['data']],
+                [str(service.id)]
+            )
+        response = self.auth_client.get(url, {'search': 'кино'}).json()
+        self.assertEqual(response['data'], [])
+
+    def test_services_autocomplete(self):
+        service = self.services[0]
+        service.name = 'Okko'
+        service.full_name = 'Okko: фильмы и сериалы'
+        service.save()
+        url = reverse('services-autocomplete')
+        for search in ('ok', 'сери', 'okko: фильмы'):
+            response = self.auth_client.get(url, {'search': search}).json()
+            self.assertEqual(
+                response['data'],
+                [{'id': str(service.id), 'name': 'Okko'}]
+            )
+        response = self.auth_client.get(url, {'search': 'текст 1'}).json()
+        self.assertEqual(len(response['data']), 3)
+
+    def test_services_autocomplete_invalidation(self):
+        service_prefix_index.clear()
+        build = service_prefix_index.build
+
+        def build_and_clear():
+            entries = build()
+            catalog_cache.clear_local()
+            return entries
+
+        url = reverse('services-autocomplete')
+        with patch.object(catalog_cache, 'start_listener') as start_listener:
+            with patch.object(
+                service_prefix_index,
+                'build',
+                side_effect=build_and_clear
+            ):
+                self.auth_client.get(url, {'search': 'текст'})
+            start_listener.assert_called_once()
+        self.assertIsNone(service_prefix_index.entries)
+        self.auth_client.get(url, {'search': 'текст'})
+        self.assertIsNotNone(service_prefix_index.entries)
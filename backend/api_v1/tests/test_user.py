@@ -2,16 +2,40 @@ from calendar import monthrange
 from datetime import date
 from datetime import datetime as dt
 from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
 
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from requests import RequestException, Timeout
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from api_v1.exeptions import PaymentUnavailable, SubscriptionExists
+from api_v1.utils import create_subscribe
+from backend.celery import app
 from services.models import (CategoryService, Service, Tariff, TariffCondition,
                              TariffSpecialCondition, TariffTrialPeriod)
-from users.models import UserService, UserSpecialCondition, UserTrialPeriod
+from users.admin import UserServiceAdmin
+from users.bank_client import BankBatchError, LocalBankBackend, bank_client
+from users.models import (CONDITION, FAILED, PENDING, SUCCEEDED, TRIAL_PERIOD,
+                          CashbackAccrual, ChargeProjection, SubscriptionOrder,
+                          UserService, UserSpecialCondition, UserTrialPeriod)
+from users.tasks import (accrue_cashback_chunk, cashback_accrual,
+                         charge_subscription_order, claim_due_subscriptions,
+                         create_autopay, get_autopay_queryset,
+                         place_subscription_order, reconcile_monthly_expenses,
+                         reconcile_subscribers_count, renew_due_subscriptions,
+                         renew_subscriptions, retry_subscription_orders,
+                         summarize_chunks)
 
 User = get_user_model()
 
@@ -62,6 +86,7 @@ class AnaliticsTest(APITestCase):
 
     def setUp(self):
         self.url_future_expenses = reverse('future-expenses-list')
+        self.url_subscriptions = reverse('subscriptions-list')
         self.category = CategoryService.objects.create(
             name='Текст'
         )
@@ -139,7 +164,10 @@ class AnaliticsTest(APITestCase):
                 ),
                 is_active=1,
                 auto_pay=True,
-                phone_number='+79998887766'
+                phone_number='+79998887766',
+                condition=TRIAL_PERIOD if i < 2 else CONDITION,
+                condition_count=1,
+                condition_period='M'
             )
             for i in range(3)
         )
@@ -158,11 +186,22 @@ class AnaliticsTest(APITestCase):
             start_date=self.start_date,
             end_date=self.end_date,
         )
+        call_command('backfill_monthly_expenses', stdout=StringIO())
         self.auth_client = APIClient()
         self.token = RefreshToken.for_user(self.user).access_token
         self.auth_client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
         self.anon_client = APIClient()
 
+    def run_tasks_eagerly(self):
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+    def use_local_bank(self):
+        bank_client.backend = LocalBankBackend()
+        bank_client.stats = {}
+        self.addCleanup(setattr, bank_client, 'backend', None)
+        return bank_client.backend
+
     def test_future_expenses(self):
         """Проверка будущих затрат"""
         response = self.auth_client.get(self.url_future_expenses).json()
@@ -171,3 +210,798 @@ class AnaliticsTest(APITestCase):
             self.tariff_condition[0].price * 2
         ) + (self.tariff_spec_cond.price)
         self.assertEqual(response['future_expenses'], test_expenses)
+
+    def test_subscriptions_list(self):
+        """Проверка условий тарифа в списке подписок"""
+        response = self.auth_client.get(self.url_subscriptions).json()
+        subscriptions = {
+            subscription['id']: subscription
+            for subscription in response['data']
+        }
+        for i in range(3):
+            subscription = subscriptions[str(self.userservice[i].id)]
+            self.assertEqual(subscription['count'], 1)
+            self.assertEqual(subscription['period'], 'Месяц')
+            self.assertEqual(
+                subscription['trial_period_end_date'],
+                str(self.end_date) if i < 2 else ''
+            )
+
+    def test_subscriptions_list_queries(self):
+        """Количество запросов не зависит от числа подписок"""
+        with CaptureQueriesContext(connection) as small_page:
+            self.auth_client.get(self.url_subscriptions)
+        UserService.objects.bulk_create(
+            UserService(
+                user=self.user,
+                service=self.services[i % 3],
+                tariff=self.tariff[i % 3],
+                start_date=self.start_date,
+                end_date=self.start_date,
+                cashback=1,
+                status_cashback=True,
+                expense=self.tariff_condition[i % 3].price,
+                is_active=0,
+                auto_pay=False,
+                phone_number='+79998887766'
+            )
+            for i in range(6)
+        )
+        with CaptureQueriesContext(connection) as full_page:
+            self.auth_client.get(self.url_subscriptions)
+        self.assertEqual(len(small_page), len(full_page))
+
+    def test_backfill_conditions(self):
+        """Проверка заполнения условий тарифа для старых подписок"""
+        UserService.objects.update(
+            condition='',
+            condition_count=None,
+            condition_period=''
+        )
+        call_command('backfill_conditions', batch_size=2, stdout=StringIO())
+        for i, condition in enumerate(
+            (TRIAL_PERIOD, TRIAL_PERIOD, CONDITION)
+        ):
+            subscription = UserService.objects.get(pk=self.userservice[i].pk)
+            self.assertEqual(subscription.condition, condition)
+            self.assertEqual(subscription.condition_count, 1)
+            self.assertEqual(subscription.condition_period, 'M')
+
+    def test_payment_history_pagination(self):
+        """Проверка постраничного вывода истории платежей по курсору"""
+        url = reverse('payment-history-list')
+        first_page = self.auth_client.get(url, {'skip': 2}).json()
+        self.assertEqual(len(first_page['data']), 2)
+        self.assertIsNone(first_page['previous'])
+        second_page = self.auth_client.get(first_page['next']).json()
+        self.assertEqual(len(second_page['data']), 1)
+        self.assertIsNone(second_page['next'])
+        self.assertEqual(
+            {item['id'] for item in first_page['data'] + second_page['data']},
+            {str(subscription.id) for subscription in self.userservice}
+        )
+        previous_page = self.auth_client.get(second_page['previous']).json()
+        self.assertEqual(previous_page['data'], first_page['data'])
+        offset_page = self.auth_client.get(url, {'skip': 2, 'top': 2}).json()
+        self.assertEqual(offset_page['data'], second_page['data'])
+        response = self.auth_client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_conditional_get(self):
+        """Проверка ответа 304 при неизменных данных пользователя"""
+        for url in (
+            self.url_subscriptions,
+            self.url_future_expenses,
+            reverse('cashback-list')
+        ):
+            response = self.auth_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_304_NOT_MODIFIED
+            )
+            self.assertEqual(len(queries), 1)
+        subscription = self.userservice[0]
+        subscription.auto_pay = False
+        subscription.save()
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        for url, params in (
+            (reverse('analytics-summary-list'), {'start_date': 'x'}),
+            (reverse('future-expenses-forecast'), {'months': 0}),
+            (reverse('cashback-list'), {'start_date': 'x'})
+        ):
+            response = self.auth_client.get(
+                url,
+                params,
+                HTTP_IF_NONE_MATCH='*'
+            )
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_subscribers_count(self):
+        """Проверка счетчика активных подписок сервиса"""
+        reconcile_subscribers_count()
+        service = self.services[0]
+        service.refresh_from_db()
+        self.assertEqual(service.subscribers_count, 1)
+        url = reverse('subscriptions-detail', args=(self.userservice[0].pk,))
+        self.auth_client.patch(url, {'auto_pay': False})
+        service.refresh_from_db()
+        self.assertEqual(service.subscribers_count, 0)
+        response = self.auth_client.get(reverse('popular-services-list'))
+        self.assertEqual(
+            response.json()['data'][-1]['id'],
+            str(service.id)
+        )
+
+    def test_expenses(self):
+        """Проверка расходов за период"""
+        other_user = User.objects.create_user(
+            email='otheruser@ya.ru',
+            password='testpass'
+        )
+        UserService.objects.create(
+            user=other_user,
+            service=self.services[2],
+            tariff=self.tariff[2],
+            start_date=self.start_date,
+            end_date=self.end_date,
+            cashback=1,
+            status_cashback=True,
+            expense=1000,
+            is_active=1,
+            auto_pay=True,
+            phone_number='+79998887766'
+        )
+        period = {'start_date': self.start_date, 'end_date': self.end_date}
+        total = sum(
+            subscription.expense for subscription in self.userservice
+        )
+        response = self.auth_client.get(reverse('expenses-list'), period)
+        self.assertEqual(response.json(), {'expenses': total})
+        response = self.auth_client.get(
+            reverse('expenses-by-category-list'),
+            period
+        )
+        self.assertEqual(
+            response.json(),
+            {'data': [{'name': self.category.name, 'expenses': total}]}
+        )
+        response = self.auth_client.get(
+            reverse('expenses-list'),
+            {'start_date': self.end_date, 'end_date': self.start_date}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_monthly_expenses(self):
+        """Проверка расходов за полные месяцы"""
+        total = sum(
+            subscription.expense for subscription in self.userservice
+        )
+        start_date = self.start_date.replace(day=1)
+        end_date = self.end_date.replace(day=monthrange(
+            self.end_date.year,
+            self.end_date.month
+        )[1])
+        period = {'start_date': start_date, 'end_date': end_date}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(reverse('expenses-list'), period)
+        self.assertEqual(response.json(), {'expenses': total})
+        self.assertFalse(any(
+            UserService._meta.db_table in query['sql']
+            for query in queries.captured_queries
+        ))
+        subscription = create_subscribe(
+            self.tariff[2],
+            30,
+            self.user,
+            '+79998887766'
+        )
+        response = self.auth_client.get(reverse('expenses-list'), period)
+        self.assertEqual(
+            response.json(),
+            {'expenses': total + subscription.expense}
+        )
+        response = self.auth_client.get(
+            reverse('expenses-by-category-list'),
+            {'start_date': self.start_date, 'end_date': end_date}
+        )
+        self.assertEqual(response.json(), {'data': [{
+            'name': self.category.name,
+            'expenses': total + subscription.expense
+        }]})
+        self.assertEqual(reconcile_monthly_expenses(), 0)
+        subscription.delete()
+        self.assertEqual(reconcile_monthly_expenses(), 1)
+        response = self.auth_client.get(reverse('expenses-list'), period)
+        self.assertEqual(response.json(), {'expenses': total})
+
+    def test_expenses_series(self):
+        """Проверка расходов по интервалам"""
+        month = self.start_date.replace(day=1)
+        end_date = self.end_date
+        dates = []
+        while month <= end_date:
+            dates.append(str(month))
+            month += timedelta(days=monthrange(month.year, month.month)[1])
+        total = sum(
+            subscription.expense for subscription in self.userservice
+        )
+        period = {'start_date': self.start_date, 'end_date': end_date}
+        response = self.auth_client.get(reverse('expenses-series'), period)
+        self.assertEqual(response.json(), {
+            'dates': dates,
+            'expenses': [total] + [0] * (len(dates) - 1)
+        })
+        response = self.auth_client.get(
+            reverse('expenses-series'),
+            {**period, 'bucket': 'day'}
+        ).json()
+        self.assertEqual(
+            len(response['dates']),
+            (end_date - self.start_date).days + 1
+        )
+        self.assertEqual(response['dates'][0], str(self.start_date))
+        self.assertEqual(response['expenses'][0], total)
+        self.assertEqual(sum(response['expenses']), total)
+        response = self.auth_client.get(
+            reverse('expenses-series'),
+            {**period, 'bucket': 'year'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expenses_forecast(self):
+        """Проверка прогноза затрат по месяцам"""
+        today = date.today()
+        month_dates = [today.replace(day=1)]
+        while len(month_dates) < 12:
+            month = month_dates[-1]
+            month_dates.append(
+                month + timedelta(days=monthrange(month.year, month.month)[1])
+            )
+        last_day = month_dates[-1].replace(day=monthrange(
+            month_dates[-1].year,
+            month_dates[-1].month
+        )[1])
+        prices = (
+            [self.tariff_condition[0].price],
+            [self.tariff_spec_cond.price, self.tariff_condition[1].price],
+            [self.tariff_condition[2].price]
+        )
+
+        def get_forecast(end_dates):
+            expenses = [0] * 12
+            for end_date, subscription_prices in zip(end_dates, prices):
+                charge_date = end_date + timedelta(days=1)
+                while charge_date <= last_day:
+                    month = (
+                        (charge_date.year - today.year) * 12
+                        + charge_date.month - today.month
+                    )
+                    expenses[month] += subscription_prices[0]
+                    subscription_prices = subscription_prices[1:] or (
+                        subscription_prices
+                    )
+                    charge_date += timedelta(days=31)
+            return expenses
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(
+                reverse('future-expenses-forecast')
+            )
+        self.assertEqual(response.json(), {
+            'months': [str(month) for month in month_dates],
+            'expenses': get_forecast([self.end_date] * 3)
+        })
+        self.assertEqual(len(queries), 2)
+        UserService.objects.filter(pk=self.userservice[2].pk).update(
+            end_date=today
+        )
+        response = self.auth_client.get(reverse('future-expenses-forecast'))
+        self.assertEqual(
+            response.json()['expenses'],
+            get_forecast([self.end_date, self.end_date, today])
+        )
+        response = self.auth_client.get(
+            reverse('future-expenses-forecast'),
+            {'months': 0}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_charge_projection(self):
+        """Проверка прогноза списаний по сервисам"""
+        call_command('build_charge_projection', days=60, stdout=StringIO())
+        projection = {
+            (row.date, row.service_id): (
+                row.renewals, row.charges, row.cashback
+            )
+            for row in ChargeProjection.objects.all()
+        }
+        first_date = self.end_date + timedelta(days=1)
+        second_date = self.end_date + timedelta(days=32)
+        self.assertEqual(projection, {
+            (first_date, self.services[0].id): (1, 200, 0),
+            (second_date, self.services[0].id): (1, 200, 0),
+            (first_date, self.services[1].id): (1, 45, 0),
+            (second_date, self.services[1].id): (1, 200, 2),
+            (first_date, self.services[2].id): (1, 200, 4),
+            (second_date, self.services[2].id): (1, 200, 4),
+        })
+        Service.objects.filter(pk=self.services[2].pk).update(cashback=None)
+        call_command('build_charge_projection', days=60, stdout=StringIO())
+        self.assertEqual(
+            ChargeProjection.objects.get(
+                date=first_date,
+                service=self.services[2]
+            ).cashback,
+            0
+        )
+        TariffCondition.objects.filter(tariff=self.tariff[1]).delete()
+        call_command('build_charge_projection', days=60, stdout=StringIO())
+        self.assertEqual(
+            list(ChargeProjection.objects.filter(
+                service=self.services[1]
+            ).values_list('date', 'charges')),
+            [(first_date, 45)]
+        )
+        response = self.auth_client.get(reverse('future-expenses-forecast'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }})
+    def test_analytics_summary(self):
+        """Проверка сводной аналитики за период"""
+        period = {'start_date': self.start_date, 'end_date': self.end_date}
+        expenses = self.auth_client.get(reverse('expenses-list'), period)
+        by_category = self.auth_client.get(
+            reverse('expenses-by-category-list'),
+            period
+        )
+        future_expenses = self.auth_client.get(self.url_future_expenses)
+        cashback = self.auth_client.get(reverse('cashback-list'), period)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(
+                reverse('analytics-summary-list'),
+                period
+            )
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.json(), {
+            'expenses': expenses.json()['expenses'],
+            'expenses_by_category': by_category.json()['data'],
+            'future_expenses': future_expenses.json()['future_expenses'],
+            'cashback': cashback.json()['cashback']
+        })
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.auth_client.get(
+                reverse('analytics-summary-list'),
+                period
+            )
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cached.json(), response.json())
+        UserService.objects.filter(pk=self.userservice[0].pk).update(
+            expense=0
+        )
+        self.userservice[2].save()
+        response = self.auth_client.get(
+            reverse('analytics-summary-list'),
+            period
+        )
+        self.assertEqual(
+            response.json()['expenses'],
+            expenses.json()['expenses'] - self.userservice[0].expense
+        )
+
+    def test_cashback_accrual(self):
+        """Проверка повторного начисления кэшбека после сбоя"""
+        self.run_tasks_eagerly()
+        bank = self.use_local_bank()
+        bank.status_codes = [400]
+        UserService.objects.update(status_cashback=False)
+        self.assertEqual(cashback_accrual(chunk_size=2), 2)
+        self.assertEqual(len(bank.calls), 3)
+        self.assertEqual(
+            UserService.objects.filter(status_cashback=False).count(),
+            1
+        )
+        accrual = CashbackAccrual.objects.get()
+        self.assertEqual((accrual.accrued, accrual.failed), (2, 1))
+        chunks = accrual.chunks.all()
+        self.assertTrue(all(chunk.finished for chunk in chunks))
+        self.assertEqual(sum(chunk.failed for chunk in chunks), 1)
+        accrue_cashback_chunk(chunks[0].pk)
+        self.assertEqual(len(bank.calls), 3)
+        self.assertEqual(cashback_accrual(chunk_size=2), 1)
+        self.assertEqual(cashback_accrual(chunk_size=2), 0)
+        self.assertEqual(len(bank.calls), 4)
+        accrual.refresh_from_db()
+        self.assertEqual((accrual.accrued, accrual.failed), (3, 0))
+
+    def test_autopay(self):
+        """Проверка продления подписок по частям"""
+        self.run_tasks_eagerly()
+        yesterday = date.today() - timedelta(days=1)
+        self.user_special_condition.delete()
+        UserService.objects.filter(
+            pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+        ).update(end_date=yesterday)
+        bank = self.use_local_bank()
+        self.assertEqual(create_autopay(chunk_size=1), 2)
+        self.assertEqual(
+            sorted(data['price'] for path, data in bank.calls),
+            sorted([
+                self.tariff_spec_cond.price,
+                self.tariff_condition[2].price
+            ])
+        )
+        self.assertEqual(bank_client.stats['payment/batch/']['requests'], 2)
+        self.assertEqual(
+            {data['key'] for path, data in bank.calls},
+            {
+                f'renewal:{self.userservice[i].pk}:{yesterday}'
+                for i in (1, 2)
+            }
+        )
+        renewed = UserService.objects.filter(
+            is_active=True,
+            start_date=date.today()
+        )
+        self.assertEqual(
+            {(renewal.tariff_id, renewal.expense) for renewal in renewed},
+            {
+                (self.tariff[1].id, self.tariff_spec_cond.price),
+                (self.tariff[2].id, self.tariff_condition[2].price)
+            }
+        )
+        self.assertFalse(UserService.objects.filter(
+            pk__in=[self.userservice[1].pk, self.userservice[2].pk],
+            is_active=True
+        ).exists())
+        summary = summarize_chunks([
+            {'processed': 2, 'charged': 1, 'failed': 1, 'elapsed': 0.5},
+            {'processed': 1, 'charged': 1, 'failed': 0, 'elapsed': 1.5}
+        ])
+        self.assertEqual(summary, {
+            'chunks': 2,
+            'slowest': 1.5,
+            'processed': 3,
+            'charged': 2,
+            'failed': 1,
+            'elapsed': 2.0
+        })
+
+    def test_autopay_claim_queries(self):
+        """Проверка выбора подписок для продления"""
+        bank = self.use_local_bank()
+        bank.status_codes = [400] * 6
+        yesterday = date.today() - timedelta(days=1)
+        UserService.objects.update(end_date=yesterday, condition='')
+        UserTrialPeriod.objects.update(end_date=yesterday)
+        UserSpecialCondition.objects.update(end_date=yesterday)
+        subscriptions = list(UserService.objects.select_related(
+            'user',
+            'tariff__tariff_condition',
+            'tariff__tariff_special_condition'
+        ))
+        with CaptureQueriesContext(connection) as queries:
+            declined, errors, unknown = renew_subscriptions(subscriptions)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual((len(declined), errors, unknown), (3, [], []))
+        self.assertEqual(
+            sorted(data['price'] for path, data in bank.calls),
+            sorted([
+                self.tariff_condition[0].price,
+                self.tariff_spec_cond.price,
+                self.tariff_condition[2].price
+            ])
+        )
+        result = renew_due_subscriptions(chunk_size=2)
+        self.assertEqual(
+            (result['processed'], result['charged'], result['failed']),
+            (3, 0, 3)
+        )
+        self.assertFalse(get_autopay_queryset().exists())
+        self.assertEqual(renew_due_subscriptions(chunk_size=2)['processed'], 0)
+
+    def test_autopay_apply_errors(self):
+        """Проверка продления при ошибке применения оплаченной подписки"""
+        self.use_local_bank()
+        UserService.objects.filter(
+            pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+        ).update(end_date=date.today() - timedelta(days=1))
+        with self.assertLogs('users.tasks', 'ERROR'):
+            result = renew_due_subscriptions(chunk_size=10)
+        self.assertEqual(
+            (
+                result['processed'],
+                result['charged'],
+                result['failed'],
+                result['errors']
+            ),
+            (2, 1, 0, 1)
+        )
+        self.assertTrue(
+            UserService.objects.get(pk=self.userservice[1].pk).is_active
+        )
+        self.assertFalse(
+            UserService.objects.get(pk=self.userservice[2].pk).is_active
+        )
+
+    def test_autopay_cancelled_after_claim(self):
+        """Проверка отключения автоплатежа после выбора подписки"""
+        bank = self.use_local_bank()
+        UserService.objects.filter(
+            pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+        ).update(end_date=date.today() - timedelta(days=1))
+
+        def claim_and_cancel(chunk_size):
+            subscriptions = claim_due_subscriptions(chunk_size)
+            UserService.objects.filter(pk=self.userservice[1].pk).update(
+                auto_pay=False
+            )
+            return subscriptions
+
+        with patch(
+            'users.tasks.claim_due_subscriptions',
+            side_effect=claim_and_cancel
+        ):
+            result = renew_due_subscriptions(chunk_size=10)
+        self.assertEqual(
+            (result['processed'], result['charged'], result['cancelled']),
+            (2, 1, 1)
+        )
+        self.assertEqual(len(bank.calls), 1)
+        self.assertTrue(
+            UserService.objects.get(pk=self.userservice[1].pk).is_active
+        )
+        self.assertFalse(UserService.objects.filter(
+            tariff=self.tariff[1],
+            start_date=date.today()
+        ).exists())
+
+    def test_autopay_bank_unavailable(self):
+        """Проверка продления при недоступности банка"""
+        bank = self.use_local_bank()
+        UserService.objects.filter(
+            pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+        ).update(end_date=date.today() - timedelta(days=1))
+        with patch.object(bank, 'post_batch', side_effect=RequestException):
+            result = renew_due_subscriptions(chunk_size=10)
+        self.assertEqual(
+            (result['processed'], result['failed'], result['unknown']),
+            (2, 0, 2)
+        )
+        self.assertTrue(all(
+            renew_at < timezone.now() + timedelta(hours=1)
+            for renew_at in UserService.objects.filter(
+                pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+            ).values_list('renew_at', flat=True)
+        ))
+        with patch.object(bank, 'post_batch', return_value=[True]):
+            with self.assertRaises(BankBatchError):
+                bank_client.payment_many(
+                    (self.user, 100, None) for _ in range(2)
+                )
+
+    def test_autopay_schedule(self):
+        """Проверка выбора подписок по времени продления"""
+        yesterday = date.today() - timedelta(days=1)
+        UserService.objects.update(end_date=yesterday)
+        UserService.objects.filter(pk=self.userservice[0].pk).update(
+            renew_at=timezone.now() + timedelta(hours=1)
+        )
+        UserService.objects.filter(pk=self.userservice[1].pk).update(
+            renew_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(
+            set(get_autopay_queryset().values_list('pk', flat=True)),
+            {self.userservice[1].pk, self.userservice[2].pk}
+        )
+        subscription = create_subscribe(
+            self.tariff[2],
+            30,
+            self.user,
+            '+79998887766'
+        )
+        renew_at = timezone.localtime(subscription.renew_at)
+        self.assertEqual(
+            renew_at.date(),
+            subscription.end_date + timedelta(days=1)
+        )
+        bank = self.use_local_bank()
+        bank.status_codes = [400] * 2
+        result = renew_due_subscriptions(chunk_size=10)
+        self.assertEqual((result['processed'], result['failed']), (2, 2))
+        self.assertFalse(get_autopay_queryset().exists())
+        self.assertTrue(all(
+            renew_at > timezone.now() + timedelta(hours=23)
+            for renew_at in UserService.objects.filter(
+                pk__in=[self.userservice[1].pk, self.userservice[2].pk]
+            ).values_list('renew_at', flat=True)
+        ))
+        subscription.end_date += timedelta(days=10)
+        UserServiceAdmin(UserService, admin.site).save_model(
+            None,
+            subscription,
+            SimpleNamespace(changed_data=['end_date']),
+            True
+        )
+        subscription.refresh_from_db()
+        self.assertEqual(
+            timezone.localtime(subscription.renew_at).date(),
+            subscription.end_date + timedelta(days=1)
+        )
+
+    def test_subscribe_unknown_payment(self):
+        """Проверка повторного подключения после обрыва связи с банком"""
+        bank = self.use_local_bank()
+
+        def lost_response(path, data):
+            LocalBankBackend.post(bank, path, data)
+            raise Timeout
+
+        data = {'tariff': self.tariff[2].id, 'phone_number': '+79990001122'}
+        with patch.object(bank, 'post', side_effect=lost_response):
+            response = self.auth_client.post(self.url_subscriptions, data)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertFalse(
+            UserService.objects.filter(phone_number='+79990001122').exists()
+        )
+        response = self.auth_client.post(self.url_subscriptions, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(bank.calls), 1)
+
+    def test_async_subscribe_duplicates(self):
+        """Проверка повторного заказа той же подписки"""
+        bank = self.use_local_bank()
+        orders = [
+            place_subscription_order(
+                user=self.user,
+                tariff=self.tariff[2],
+                phone_number='+79990001122'
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(charge_subscription_order(orders[1].pk), FAILED)
+        self.assertEqual(charge_subscription_order(orders[0].pk), SUCCEEDED)
+        self.assertEqual(len(bank.calls), 1)
+        order = place_subscription_order(
+            user=self.user,
+            tariff=self.tariff[2],
+            phone_number='+79990001122'
+        )
+        self.assertEqual(charge_subscription_order(order.pk), FAILED)
+        self.assertEqual(len(bank.calls), 1)
+        self.assertEqual(
+            UserService.objects.filter(phone_number='+79990001122').count(),
+            1
+        )
+        with self.captureOnCommitCallbacks():
+            place_subscription_order(
+                user=self.user,
+                tariff=self.tariff[1],
+                phone_number='+79990001122'
+            )
+        response = self.auth_client.post(
+            self.url_subscriptions,
+            {'tariff': self.tariff[1].id, 'phone_number': '+79990001122'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json()['detail'],
+            SubscriptionExists.default_detail
+        )
+        self.assertEqual(len(bank.calls), 1)
+
+    def test_retry_subscription_orders(self):
+        """Проверка повторной постановки зависших заказов"""
+        self.run_tasks_eagerly()
+        bank = self.use_local_bank()
+        with self.captureOnCommitCallbacks():
+            order = place_subscription_order(
+                user=self.user,
+                tariff=self.tariff[2],
+                phone_number='+79990001122'
+            )
+        self.assertEqual(order.status, PENDING)
+        self.assertEqual(retry_subscription_orders(), 0)
+        SubscriptionOrder.objects.filter(pk=order.pk).update(
+            updated=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(retry_subscription_orders(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, SUCCEEDED)
+        self.assertEqual(len(bank.calls), 1)
+        self.assertEqual(retry_subscription_orders(), 0)
+
+    def test_async_subscribe_unknown_payment(self):
+        """Проверка заказа после обрыва связи с банком"""
+        self.run_tasks_eagerly()
+        bank = self.use_local_bank()
+
+        def lost_response(path, data):
+            LocalBankBackend.post(bank, path, data)
+            raise Timeout
+
+        with self.captureOnCommitCallbacks():
+            order = place_subscription_order(
+                user=self.user,
+                tariff=self.tariff[2],
+                phone_number='+79990001122'
+            )
+        with patch.object(bank, 'post', side_effect=lost_response):
+            with self.assertRaises(PaymentUnavailable):
+                charge_subscription_order(order.pk)
+        order.refresh_from_db()
+        self.assertEqual(order.status, PENDING)
+        SubscriptionOrder.objects.filter(pk=order.pk).update(
+            updated=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(retry_subscription_orders(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, SUCCEEDED)
+        self.assertEqual(len(bank.calls), 1)
+
+    def test_async_subscribe(self):
+        """Проверка асинхронного подключения и возобновления подписки"""
+        self.run_tasks_eagerly()
+        bank = self.use_local_bank()
+        bank.status_codes = [400]
+        for expected in (FAILED, SUCCEEDED):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.auth_client.post(
+                    self.url_subscriptions,
+                    {'tariff': self.tariff[2].id,
+                     'phone_number': '+79990001122'},
+                    HTTP_PREFER='respond-async',
+                    HTTP_IDEMPOTENCY_KEY='order-1'
+                )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response['Location'], response.json()['url'])
+            order = self.auth_client.get(response['Location']).json()
+            self.assertEqual(order['status'], expected)
+        subscription = UserService.objects.get(phone_number='+79990001122')
+        self.assertEqual(order['subscription']['id'], str(subscription.id))
+        self.assertEqual(len(bank.calls), 2)
+        response = self.auth_client.post(
+            self.url_subscriptions,
+            {'tariff': self.tariff[2].id, 'phone_number': '+79990003344'},
+            HTTP_PREFER='respond-async',
+            HTTP_IDEMPOTENCY_KEY='order-1'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        UserService.objects.filter(pk=self.userservice[0].pk).update(
+            end_date=date.today() - timedelta(days=1),
+            is_active=False,
+            auto_pay=False
+        )
+        url = reverse('subscriptions-detail', args=(self.userservice[0].pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.auth_client.patch(
+                url,
+                {'auto_pay': True},
+                HTTP_PREFER='respond-async'
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        order = self.auth_client.get(response['Location']).json()
+        self.assertEqual(order['status'], SUCCEEDED)
+        self.assertEqual(
+            order['subscription']['price'],
+            self.tariff_condition[0].price
+        )
+        response = self.auth_client.patch(
+            url,
+            {'auto_pay': False},
+            HTTP_PREFER='respond-async'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
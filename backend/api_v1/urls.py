@@ -7,12 +7,14 @@ from rest_framework.routers import SimpleRouter
 
 from users.utils import get_full_url
 
-from .services.views import (CategoryImageViewSet, PopularServiceViewSet,
+from .services.views import (CatalogBundleViewSet, CategoryImageViewSet,
+                             PopularServiceViewSet,
                              ServiceCategoryImageViewSet, SevicesViewSet,
                              TariffViewSet)
-from .users.views import (CashbackViewSet, CustomTokenObtainPairView,
-                          CustomUserViewSet, ExpensesByCategoryViewSet,
-                          ExpensesViewSet, FutureExpensesViewSet,
+from .users.views import (AnalyticsSummaryViewSet, CashbackViewSet,
+                          CustomTokenObtainPairView, CustomUserViewSet,
+                          ExpensesByCategoryViewSet, ExpensesViewSet,
+                          FutureExpensesViewSet, SubscriptionOrderViewSet,
                           UserHistoryPaymentViewSet, UserServiceViewSet)
 
 router = SimpleRouter()
@@ -43,11 +45,21 @@ router.register(
     TariffViewSet,
     basename='tariffs'
 )
+router.register(
+    'catalog/bundle',
+    CatalogBundleViewSet,
+    basename='catalog-bundle'
+)
 router.register(
     'subscriptions',
     UserServiceViewSet,
     basename='subscriptions'
 )
+router.register(
+    'subscription-orders',
+    SubscriptionOrderViewSet,
+    basename='subscription-orders'
+)
 router.register(
     'payment-history',
     UserHistoryPaymentViewSet,
@@ -73,6 +85,11 @@ router.register(
     CashbackViewSet,
     basename='cashback'
 )
+router.register(
+    'analytics/summary',
+    AnalyticsSummaryViewSet,
+    basename='analytics-summary'
+)
 
 urlpatterns = [
     path(
@@ -2,20 +2,20 @@ from datetime import datetime, timedelta
 from re import search
 
 from django.contrib.auth.models import update_last_login
-from requests import post
+from django.db import transaction
+from django.db.models import Manager
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.settings import api_settings
 
-from services.models import TariffSpecialCondition, TariffTrialPeriod
-from users.models import UserService, UserSpecialCondition, UserTrialPeriod
-from users.utils import get_full_url
+from users.bank_client import get_renewal_key
+from users.models import TRIAL_PERIOD, SubscriptionOrder, UserService
+from users.tasks import place_subscription_order
 
-from ..exeptions import PaymentError
-from ..utils import (connect_special_condition, create_subscribe, get_days,
-                     get_full_name_period, get_past_expenses_category,
-                     get_tariff_condition)
+from ..analytics import BUCKETS, MONTH_BUCKET
+from ..utils import (get_full_name_period, get_tariff_condition,
+                     get_user_conditions, subscribe, update_subscribers_count)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -60,15 +60,17 @@ class UserServiceRetrieveSerializer(serializers.ModelSerializer):
             'price'
         )
 
+    def get_conditions(self, obj):
+        conditions = getattr(self, 'conditions', None)
+        if conditions is None:
+            return get_user_conditions((obj,))
+        return conditions
+
     def get_trial_period_end_date(self, obj):
-        if UserTrialPeriod.objects.filter(
-            user=obj.user,
-            service=obj.service
-        ).exists():
-            return obj.service.trial_period.get(
-                user=self.context['request'].user
-            ).end_date
-        return ''
+        if obj.condition == TRIAL_PERIOD:
+            return obj.end_date
+        trial_periods, _ = self.get_conditions(obj)
+        return trial_periods.get((obj.user_id, obj.service_id), '')
 
     def get_payment_date(self, obj):
         if obj.end_date >= datetime.now().date() and obj.auto_pay:
@@ -76,6 +78,16 @@ class UserServiceRetrieveSerializer(serializers.ModelSerializer):
         return ''
 
 
+class UserServiceBulkListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        data = list(data)
+        self.child.conditions = get_user_conditions(data)
+        return super().to_representation(data)
+
+
 class UserServiceListSerializer(UserServiceRetrieveSerializer):
     logo = serializers.ImageField(source='service.image_logo')
     is_active = serializers.SerializerMethodField()
@@ -84,6 +96,7 @@ class UserServiceListSerializer(UserServiceRetrieveSerializer):
 
     class Meta:
         model = UserService
+        list_serializer_class = UserServiceBulkListSerializer
         fields = (
             'id',
             'logo',
@@ -105,19 +118,17 @@ class UserServiceListSerializer(UserServiceRetrieveSerializer):
             return 0
         return 3
 
+    def get_terms(self, obj):
+        if obj.condition:
+            return obj.condition_count, obj.condition_period
+        condition = get_tariff_condition(obj, self.get_conditions(obj))
+        return condition.count, condition.period
+
     def get_count(self, obj):
-        return get_tariff_condition(
-            obj,
-            self.context['request'].user
-        ).count
+        return self.get_terms(obj)[0]
 
     def get_period(self, obj):
-        period = get_tariff_condition(
-            obj,
-            self.context['request'].user
-        ).period
-        count = self.get_count(obj)
-        return get_full_name_period(count, period)
+        return get_full_name_period(*self.get_terms(obj))
 
 
 class UserServiceCreateSerialiser(serializers.ModelSerializer):
@@ -145,85 +156,27 @@ class UserServiceCreateSerialiser(serializers.ModelSerializer):
             )
         return super().validate(attrs)
 
+    def get_idempotency_key(self):
+        request = self.context['request']
+        key = request.headers.get('Idempotency-Key')
+        if key:
+            return f'subscribe:{request.user.pk}:{key[:64]}'
+        return None
+
     def create(self, validated_data):
-        url = get_full_url('payment/')
-        if (TariffTrialPeriod.objects.filter(
-                tariff=validated_data['tariff']
-            ).exists()
-            and not UserTrialPeriod.objects.filter(
-                user=self.context['request'].user,
-                service=validated_data['tariff'].service
-        ).exists()
-        ):
-            response = post(
-                url,
-                data={
-                    'user': self.context['request'].user,
-                    'price': validated_data['tariff'].tariff_trial_period.price
-                }
-            )
-            if response.status_code != 200:
-                raise PaymentError
-            days = get_days(validated_data['tariff'].tariff_trial_period)
-            user_service = UserService.objects.create(
-                user=self.context['request'].user,
-                service=validated_data['tariff'].service,
-                tariff=validated_data['tariff'],
-                start_date=datetime.now().date(),
-                end_date=datetime.now().date() + timedelta(days=days),
-                expense=validated_data['tariff'].tariff_trial_period.price,
-                cashback=0,
-                is_active=True,
-                auto_pay=True,
-                status_cashback=False,
-                phone_number=validated_data['phone_number']
-            )
-            UserTrialPeriod.objects.create(
-                user=self.context['request'].user,
-                service=validated_data['tariff'].service,
-                start_date=datetime.now().date(),
-                end_date=datetime.now().date() + timedelta(days=days)
-            )
-            return user_service
-        if TariffSpecialCondition.objects.filter(
-            tariff=validated_data['tariff']
-        ).exists()\
-            and not UserSpecialCondition.objects.filter(
-                user=self.context['request'].user,
-                tariff=validated_data['tariff']
-        ).exists():
-            price = validated_data['tariff'].tariff_special_condition.price
-            response = post(
-                url,
-                data={
-                    'user': self.context['request'].user,
-                    'price': price
-                }
-            )
-            if response.status_code != 200:
-                raise PaymentError
-            days = get_days(validated_data['tariff'].tariff_special_condition)
-            return connect_special_condition(
-                object=validated_data['tariff'],
-                days=days,
-                user=self.context['request'].user,
-                phone_number=validated_data['phone_number']
-            )
-        response = post(
-            url,
-            data={
-                'user': self.context['request'].user,
-                'price': validated_data['tariff'].tariff_condition.price
-            }
+        return subscribe(
+            validated_data['tariff'],
+            self.context['request'].user,
+            validated_data['phone_number'],
+            self.get_idempotency_key()
         )
-        if response.status_code != 200:
-            raise PaymentError
-        days = get_days(validated_data['tariff'].tariff_condition)
-        return create_subscribe(
-            object=validated_data['tariff'],
-            days=days,
+
+    def enqueue(self):
+        return place_subscription_order(
+            key=self.get_idempotency_key(),
             user=self.context['request'].user,
-            phone_number=validated_data['phone_number']
+            tariff=self.validated_data['tariff'],
+            phone_number=self.validated_data['phone_number']
         )
 
     def to_representation(self, instance):
@@ -255,52 +208,36 @@ class UserServiceUpdateSerialiser(serializers.ModelSerializer):
             )
         return super().validate(attrs)
 
+    def is_resume(self):
+        return (self.instance.end_date < datetime.now().date()
+                and self.validated_data['auto_pay'])
+
     def update(self, instance, validated_data):
-        if instance.end_date < datetime.now().date()\
-           and validated_data['auto_pay']:
-            url = get_full_url('payment/')
-            if TariffSpecialCondition.objects.filter(
-                tariff=instance.tariff
-            ).exists()\
-                and not UserSpecialCondition.objects.filter(
-                    user=self.context['request'].user,
-                    tariff=instance.tariff
-            ).exists():
-                price = instance.tariff.tariff_special_condition.price
-                response = post(
-                    url,
-                    data={
-                        'user': self.context['request'].user,
-                        'price': price
-                    }
-                )
-                if response.status_code != 200:
-                    raise PaymentError
-                days = get_days(instance.tariff.tariff_special_condition)
-                return connect_special_condition(
-                    object=instance.tariff,
-                    days=days,
-                    user=instance.user,
-                    phone_number=instance.phone_number
-                )
-            price = instance.tariff.tariff_condition.price
-            response = post(
-                url,
-                data={
-                    'user': self.context['request'].user,
-                    'price': price
-                }
+        if self.is_resume():
+            return subscribe(
+                instance.tariff,
+                instance.user,
+                instance.phone_number,
+                get_renewal_key(instance),
+                resume=True
             )
-            if response.status_code != 200:
-                raise PaymentError
-            days = get_days(instance.tariff.tariff_condition)
-            return create_subscribe(
-                object=instance.tariff,
-                days=days,
-                user=instance.user,
-                phone_number=instance.phone_number
+        was_active = instance.is_active and instance.auto_pay
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            update_subscribers_count(
+                instance.service,
+                int(instance.is_active and instance.auto_pay) - was_active
             )
-        return super().update(instance, validated_data)
+        return instance
+
+    def enqueue(self):
+        return place_subscription_order(
+            key=get_renewal_key(self.instance),
+            user=self.instance.user,
+            tariff=self.instance.tariff,
+            phone_number=self.instance.phone_number,
+            source=self.instance
+        )
 
     def to_representation(self, instance):
         return UserServiceRetrieveSerializer(
@@ -309,6 +246,20 @@ class UserServiceUpdateSerialiser(serializers.ModelSerializer):
         ).data
 
 
+class SubscriptionOrderSerializer(serializers.ModelSerializer):
+    subscription = UserServiceRetrieveSerializer(read_only=True)
+
+    class Meta:
+        model = SubscriptionOrder
+        fields = (
+            'id',
+            'status',
+            'subscription',
+            'created',
+            'updated'
+        )
+
+
 class UserHistoryPaymentSerializer(serializers.ModelSerializer):
     logo = serializers.ImageField(source='service.image_logo')
     service_name = serializers.CharField(source='service.name')
@@ -330,29 +281,28 @@ class UserHistoryPaymentSerializer(serializers.ModelSerializer):
         )
 
 
-class ExpensesSerializer(serializers.ModelSerializer):
-    expenses = serializers.SerializerMethodField()
-
-    class Meta:
-        model = UserService
-        fields = ('expenses',)
+class AnalyticsPeriodSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
 
-    def get_expenses(self, obj):
-        total = 0
-        for expense in get_past_expenses_category(obj, self.context):
-            total += expense.get('expenses')
-        return total
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError(
+                'Дата начала периода не может быть больше даты окончания'
+            )
+        return attrs
 
 
-class ExpensesByCategorySerializer(serializers.ModelSerializer):
-    data = serializers.SerializerMethodField()
+class ExpensesSeriesSerializer(AnalyticsPeriodSerializer):
+    bucket = serializers.ChoiceField(
+        choices=BUCKETS,
+        default=MONTH_BUCKET
+    )
 
-    class Meta:
-        model = UserService
-        fields = ('data',)
 
-    def get_data(self, obj):
-        expenses = get_past_expenses_category(obj, self.context)
-        for expense in expenses:
-            del expense['service__category__name']
-        return expenses
+class ExpensesForecastSerializer(serializers.Serializer):
+    months = serializers.IntegerField(
+        min_value=1,
+        max_value=36,
+        default=12
+    )
@@ -1,27 +1,32 @@
-from calendar import monthrange
-from collections import Counter
-from datetime import date
-
-from django.db.models import F, Sum
+from django.core.cache import cache
+from django.db.models import Sum
 from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import filters, mixins, status, viewsets
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from users.models import UserService
+from users.models import SubscriptionOrder, UserService
 
+from ..analytics import (BUCKETS, get_expenses, get_expenses_by_category,
+                         get_expenses_forecast, get_expenses_series,
+                         get_renewal_filter, get_renewal_price, get_summary)
+from ..decorators import get_user_etag, user_data_etag
 from ..filters import UserServiceDateFilter, UserServiceFilter
-from ..mixins import UpdateModelMixin
-from ..pagination import ServicePagination
+from ..mixins import FilterQueryParamsMixin, UpdateModelMixin
+from ..pagination import UserServicePagination
 from ..permissions import IsAuthorOrReadOnly
-from .serializers import (CustomTokenObtainPairSerializer,
-                          ExpensesByCategorySerializer, ExpensesSerializer,
+from .serializers import (AnalyticsPeriodSerializer,
+                          CustomTokenObtainPairSerializer,
+                          ExpensesForecastSerializer, ExpensesSeriesSerializer,
+                          SubscriptionOrderSerializer,
                           UserHistoryPaymentSerializer,
                           UserServiceCreateSerialiser,
                           UserServiceListSerializer,
@@ -88,13 +93,14 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 
 class UserServiceViewSet(
+    FilterQueryParamsMixin,
     UpdateModelMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
 ):
-    pagination_class = ServicePagination
+    pagination_class = UserServicePagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = UserServiceFilter
     permission_classes = (IsAuthorOrReadOnly, )
@@ -102,6 +108,11 @@ class UserServiceViewSet(
     def get_queryset(self):
         return UserService.objects.filter(
             user=self.request.user
+        ).select_related(
+            'service',
+            'tariff__tariff_condition',
+            'tariff__tariff_special_condition',
+            'tariff__tariff_trial_period'
         )
 
     def get_serializer_class(self):
@@ -176,6 +187,7 @@ class UserServiceViewSet(
             status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED",
         }
     )
+    @user_data_etag
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -188,6 +200,7 @@ class UserServiceViewSet(
             status.HTTP_404_NOT_FOUND: "NOT_FOUND"
         }
     )
+    @user_data_etag
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
@@ -197,42 +210,114 @@ class UserServiceViewSet(
             'необходимо в теле запроса передать id тарифа и '
             'и номер телефона пользователя. Пользователь может '
             'подключить этот тариф только один раз. При отключении '
-            'подписки он сможет ее возобновить.'
+            'подписки он сможет ее возобновить. С заголовком '
+            'Prefer: respond-async платеж проводится в фоне, в ответ '
+            'возвращается заказ со ссылкой на его статус.'
         ),
         responses={
             status.HTTP_200_OK: UserServiceRetrieveSerializer,
+            status.HTTP_202_ACCEPTED: SubscriptionOrderSerializer,
             status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
             status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED",
-            status.HTTP_404_NOT_FOUND: "NOT_FOUND"
+            status.HTTP_404_NOT_FOUND: "NOT_FOUND",
+            status.HTTP_503_SERVICE_UNAVAILABLE: "SERVICE_UNAVAILABLE"
         }
     )
     def create(self, request, *args, **kwargs):
-        return super().create(request, *args, **kwargs)
+        if not self.is_async():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.accepted(serializer.enqueue())
 
     @swagger_auto_schema(
         operation_description=(
             'Отключение и возобновление подписки. Для отключения подписки '
             'необходимо в теле запроса auto_pay=False. Для возобновления '
             'auto_pay=False. Если при возобновлении срок действия подписки '
-            'окончен, создается новый экземпляр подписки.'
+            'окончен, создается новый экземпляр подписки. С заголовком '
+            'Prefer: respond-async платеж при возобновлении проводится '
+            'в фоне, в ответ возвращается заказ со ссылкой на его статус.'
         ),
         responses={status.HTTP_200_OK: UserServiceRetrieveSerializer,
+                   status.HTTP_202_ACCEPTED: SubscriptionOrderSerializer,
                    status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
                    status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED",
                    status.HTTP_403_FORBIDDEN: "FORBIDDEN",
-                   status.HTTP_404_NOT_FOUND: "NOT_FOUND"
+                   status.HTTP_404_NOT_FOUND: "NOT_FOUND",
+                   status.HTTP_503_SERVICE_UNAVAILABLE: "SERVICE_UNAVAILABLE"
                    }
     )
     def partial_update(self, request, *args, **kwargs):
-        return super().partial_update(request, *args, **kwargs)
+        if not self.is_async():
+            return super().partial_update(request, *args, **kwargs)
+        serializer = self.get_serializer(
+            self.get_object(),
+            data=request.data,
+            partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        if not serializer.is_resume():
+            serializer.save()
+            return Response(serializer.data)
+        return self.accepted(serializer.enqueue())
+
+    def is_async(self):
+        return 'respond-async' in self.request.headers.get('Prefer', '')
+
+    def accepted(self, order):
+        url = reverse(
+            'subscription-orders-detail',
+            args=(order.pk,),
+            request=self.request
+        )
+        data = SubscriptionOrderSerializer(
+            order,
+            context=self.get_serializer_context()
+        ).data
+        data['url'] = url
+        return Response(
+            data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url}
+        )
+
+
+class SubscriptionOrderViewSet(
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet
+):
+    serializer_class = SubscriptionOrderSerializer
+
+    def get_queryset(self):
+        return SubscriptionOrder.objects.filter(
+            user=self.request.user
+        ).select_related(
+            'subscription__service',
+            'subscription__tariff'
+        )
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Возвращает статус заказа подписки, созданного асинхронным '
+            'подключением или возобновлением. Статус P - ожидает оплаты, '
+            'S - подписка подключена, F - ошибка совершения платежа.'
+        ),
+        responses={
+            status.HTTP_200_OK: SubscriptionOrderSerializer,
+            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED",
+            status.HTTP_404_NOT_FOUND: "NOT_FOUND"
+        }
+    )
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class UserHistoryPaymentViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserHistoryPaymentSerializer
-    pagination_class = ServicePagination
-    filter_backends = (filters.OrderingFilter, DjangoFilterBackend)
+    pagination_class = UserServicePagination
+    filter_backends = (DjangoFilterBackend, )
     filterset_class = UserServiceDateFilter
-    ordering = ('-start_date',)
 
     def get_queryset(self):
         return UserService.objects.filter(
@@ -301,17 +386,21 @@ class UserHistoryPaymentViewSet(viewsets.ReadOnlyModelViewSet):
         return super().retrieve(request, *args, **kwargs)
 
 
-class ExpensesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
-    serializer_class = ExpensesSerializer
-    queryset = UserService.objects.all()
+class AnalyticsPeriodViewSet(viewsets.ViewSet):
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context.update(
-            {'start_date': self.request.GET.get('start_date'),
-             'end_date': self.request.GET.get('end_date')}
+    def get_period(self):
+        serializer = AnalyticsPeriodSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return (
+            serializer.validated_data['start_date'],
+            serializer.validated_data['end_date']
         )
-        return context
+
+    def validate_query_params(self):
+        self.get_period()
+
+
+class ExpensesViewSet(AnalyticsPeriodViewSet):
 
     @swagger_auto_schema(
         operation_description=(
@@ -322,14 +411,14 @@ class ExpensesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         manual_parameters=[
             openapi.Parameter(
                 "start_date",
-                openapi.IN_PATH,
+                openapi.IN_QUERY,
                 description=("Дата начала периода"),
                 type=openapi.TYPE_STRING,
                 required=True,
             ),
             openapi.Parameter(
                 "end_date",
-                openapi.IN_PATH,
+                openapi.IN_QUERY,
                 description=("Дата окончания периода"),
                 type=openapi.TYPE_STRING,
                 required=True,
@@ -344,36 +433,76 @@ class ExpensesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
                     )
                 }
             ),
-            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED",
-            status.HTTP_404_NOT_FOUND: "NOT_FOUND"
+            status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
+            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED"
         }
     )
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        if serializer.data:
-            return Response(serializer.data[0])
-        return Response(serializer.data)
-
-
-class ExpensesByCategoryViewSet(
-    mixins.ListModelMixin,
-    viewsets.GenericViewSet
-):
-    serializer_class = ExpensesByCategorySerializer
-    queryset = UserService.objects.all()
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context.update(
-            {'start_date': self.request.GET.get('start_date'),
-             'end_date': self.request.GET.get('end_date')}
+        return Response(
+            {'expenses': get_expenses(request.user, *self.get_period())}
+        )
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Возвращает расходы за выбранный период, '
+            'сгруппированные по дням, неделям или месяцам. '
+            'Период задается параметрами запроса start_date и end_date, '
+            'размер интервала - параметром bucket. '
+            'Даты начала интервалов и суммы расходов возвращаются '
+            'в параллельных массивах dates и expenses.'
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "start_date",
+                openapi.IN_QUERY,
+                description=("Дата начала периода"),
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "end_date",
+                openapi.IN_QUERY,
+                description=("Дата окончания периода"),
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "bucket",
+                openapi.IN_QUERY,
+                description=("Интервал группировки"),
+                type=openapi.TYPE_STRING,
+                enum=BUCKETS,
+                required=False,
+            )
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'dates': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING)
+                    ),
+                    'expenses': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER)
+                    )
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
+            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED"
+        }
+    )
+    @action(detail=False)
+    def series(self, request):
+        serializer = ExpensesSeriesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(
+            get_expenses_series(request.user, **serializer.validated_data)
         )
-        return context
+
+
+class ExpensesByCategoryViewSet(AnalyticsPeriodViewSet):
 
     @swagger_auto_schema(
         operation_description=(
@@ -384,14 +513,14 @@ class ExpensesByCategoryViewSet(
         manual_parameters=[
             openapi.Parameter(
                 "start_date",
-                openapi.IN_PATH,
+                openapi.IN_QUERY,
                 description=("Дата начала периода"),
                 type=openapi.TYPE_STRING,
                 required=True,
             ),
             openapi.Parameter(
                 "end_date",
-                openapi.IN_PATH,
+                openapi.IN_QUERY,
                 description=("Дата окончания периода"),
                 type=openapi.TYPE_STRING,
                 required=True,
@@ -417,35 +546,26 @@ class ExpensesByCategoryViewSet(
                     )
                 }
             ),
+            status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
             status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED"
         }
     )
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        if serializer.data:
-            return Response(serializer.data[0])
-        return Response(serializer.data)
+        return Response(
+            {'data': get_expenses_by_category(
+                request.user,
+                *self.get_period()
+            )}
+        )
 
 
 class FutureExpensesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
     def get_queryset(self):
-        last_day = monthrange(date.today().year, date.today().month)[1]
-        last_current_month_date = date(
-            date.today().year, date.today().month, last_day)
-        queryset = UserService.objects.filter(
-            user=self.request.user,
-            is_active=1,
-            auto_pay=1,
-            end_date__gt=date.today(),
-            end_date__lte=last_current_month_date,
+        return UserService.objects.filter(
+            get_renewal_filter(),
+            user=self.request.user
         )
-        return queryset
 
     @swagger_auto_schema(
         operation_description=(
@@ -465,29 +585,73 @@ class FutureExpensesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             status.HTTP_404_NOT_FOUND: "NOT_FOUND"
         }
     )
+    @user_data_etag
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        special_condition_expense = queryset.filter(
-            tariff__tariff_trial_period__tariff_id=F('tariff'),
-            service__trial_period__end_date=F('end_date'),
-            tariff__tariff_special_condition__tariff_id=F('tariff'),
+        expense = self.get_queryset().aggregate(
+            future_expenses=Coalesce(Sum(get_renewal_price()), 0)
         )
-        non_special_condition_expense = queryset.exclude(
-            tariff__tariff_trial_period__tariff_id=F('tariff'),
-            service__trial_period__end_date=F('end_date'),
-            tariff__tariff_special_condition__tariff_id=F('tariff'),
+        return JsonResponse(expense)
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Возвращает прогноз затрат пользователя на подписки '
+            'по месяцам, начиная с текущего, с учетом перехода '
+            'с пробного периода на специальные и обычные условия. '
+            'Количество месяцев задается параметром запроса months. '
+            'Месяцы и суммы возвращаются в параллельных массивах '
+            'months и expenses.'
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "months",
+                openapi.IN_QUERY,
+                description=("Количество месяцев"),
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            )
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'months': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING)
+                    ),
+                    'expenses': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_INTEGER)
+                    )
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
+            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED"
+        }
+    )
+    @action(detail=False)
+    @user_data_etag
+    def forecast(self, request):
+        return Response(
+            get_expenses_forecast(request.user, **self.get_forecast_params())
         )
 
-        expense = special_condition_expense.aggregate(
-            future_expenses=Coalesce(Sum('tariff__tariff_special_condition__price'), 0))
-        expense2 = non_special_condition_expense.aggregate(
-            future_expenses=Coalesce(Sum('tariff__tariff_condition__price'), 0))
-        expense = dict(Counter(expense) + Counter(expense2))
+    def get_forecast_params(self):
+        serializer = ExpensesForecastSerializer(
+            data=self.request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
 
-        return JsonResponse(expense)
+    def validate_query_params(self):
+        if self.action == 'forecast':
+            self.get_forecast_params()
 
 
-class CashbackViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class CashbackViewSet(
+    FilterQueryParamsMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet
+):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = UserServiceDateFilter
 
@@ -516,8 +680,82 @@ class CashbackViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             status.HTTP_404_NOT_FOUND: "NOT_FOUND"
         }
     )
+    @user_data_etag
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(
             self.get_queryset()
         ).aggregate(cashback=Sum('cashback'))
         return JsonResponse(queryset)
+
+
+class AnalyticsSummaryViewSet(AnalyticsPeriodViewSet):
+    cache_timeout = 300
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Возвращает для экрана аналитики одним запросом '
+            'расходы за период, расходы по категориям, '
+            'предстоящие затраты в текущем месяце и кэшбек за период. '
+            'Период задается параметрами запроса start_date и end_date. '
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "start_date",
+                openapi.IN_QUERY,
+                description=("Дата начала периода"),
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "end_date",
+                openapi.IN_QUERY,
+                description=("Дата окончания периода"),
+                type=openapi.TYPE_STRING,
+                required=True,
+            )
+        ],
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'expenses': openapi.Schema(
+                        type=openapi.TYPE_INTEGER
+                    ),
+                    'expenses_by_category': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'name': openapi.Schema(
+                                    type=openapi.TYPE_STRING
+                                ),
+                                'expenses': openapi.Schema(
+                                    type=openapi.TYPE_INTEGER
+                                )
+                            }
+                        )
+                    ),
+                    'future_expenses': openapi.Schema(
+                        type=openapi.TYPE_INTEGER
+                    ),
+                    'cashback': openapi.Schema(
+                        type=openapi.TYPE_INTEGER
+                    )
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: "BAD_REQUEST",
+            status.HTTP_401_UNAUTHORIZED: "UNAUTHORIZED"
+        }
+    )
+    @user_data_etag
+    def list(self, request, *args, **kwargs):
+        start_date, end_date = self.get_period()
+        key = (
+            f'analytics-summary:{get_user_etag(request.user)}'
+            f':{start_date}:{end_date}'
+        )
+        summary = cache.get(key)
+        if summary is None:
+            summary = get_summary(request.user, start_date, end_date)
+            cache.set(key, summary, self.cache_timeout)
+        return Response(summary)
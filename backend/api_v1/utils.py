@@ -1,48 +1,59 @@
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from math import floor
+from random import randrange
 
-from django.db.models import F, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils.timezone import make_aware
 
-from users.models import UserService, UserSpecialCondition, UserTrialPeriod
+from services.models import Service, TariffSpecialCondition, TariffTrialPeriod
+from users.bank_client import bank_client, get_subscribe_key
+from users.models import (CONDITION, PENDING, SPECIAL_CONDITION, TRIAL_PERIOD,
+                          SubscriptionOrder, User, UserMonthlyExpense,
+                          UserService, UserSpecialCondition, UserTrialPeriod)
 
+from .exeptions import PaymentError, PaymentUnavailable, SubscriptionExists
 
-def get_tariff_condition(obj, user):
-    if (
-        UserTrialPeriod.objects.filter(
-            user=obj.user,
-            service=obj.service
-        ).exists() and obj.service.trial_period.get(
-            user=user
-        ).end_date == obj.end_date
-    ):
+
+def get_user_conditions(user_services):
+    user_ids = {obj.user_id for obj in user_services}
+    trial_periods = UserTrialPeriod.objects.filter(
+        user__in=user_ids,
+        service__in={obj.service_id for obj in user_services}
+    ).values_list('user', 'service', 'end_date')
+    special_conditions = UserSpecialCondition.objects.filter(
+        user__in=user_ids,
+        tariff__in={obj.tariff_id for obj in user_services}
+    ).values_list('user', 'tariff', 'end_date')
+    return (
+        {(user, service): end_date
+         for user, service, end_date in trial_periods},
+        {(user, tariff): end_date
+         for user, tariff, end_date in special_conditions}
+    )
+
+
+def get_condition_kind(obj, conditions=None):
+    if conditions is None:
+        conditions = get_user_conditions((obj,))
+    trial_periods, special_conditions = conditions
+    if trial_periods.get((obj.user_id, obj.service_id)) == obj.end_date:
+        return TRIAL_PERIOD
+    if special_conditions.get((obj.user_id, obj.tariff_id)) == obj.end_date:
+        return SPECIAL_CONDITION
+    return CONDITION
+
+
+def get_tariff_condition(obj, conditions=None):
+    kind = obj.condition or get_condition_kind(obj, conditions)
+    if kind == TRIAL_PERIOD:
         return obj.tariff.tariff_trial_period
-    elif (
-        UserSpecialCondition.objects.filter(
-            user=obj.user,
-            tariff=obj.tariff
-        ).exists() and obj.tariff.special_conditions.get(
-            user=user
-        ).end_date == obj.end_date
-    ):
+    if kind == SPECIAL_CONDITION:
         return obj.tariff.tariff_special_condition
     return obj.tariff.tariff_condition
 
 
-def get_past_expenses_category(obj, context):
-    start_date = datetime.strptime(
-        context.get('start_date'), '%Y-%m-%d')
-    end_date = datetime.strptime(context.get('end_date'), '%Y-%m-%d')
-    expense = UserService.objects.filter(
-        user=context['request'].user,
-        start_date__range=(start_date, end_date)
-    ).values(
-        'service__category__name'
-    ).annotate(
-        name=F('service__category__name'), expenses=Sum('expense')
-    )
-    return expense
-
-
 def get_days(tariff_condition):
     if tariff_condition.period == 'M':
         return tariff_condition.count * 30
@@ -76,6 +87,74 @@ def get_full_name_period(count, period):
             return 'Лет'
 
 
+def get_renew_at(end_date):
+    return make_aware(
+        datetime.combine(end_date + timedelta(days=1), time.min)
+    ) + timedelta(seconds=randrange(24 * 60 * 60))
+
+
+def update_subscribers_count(service, delta):
+    Service.objects.filter(pk=service.pk).update(
+        subscribers_count=Greatest(F('subscribers_count') + delta, 0)
+    )
+
+
+def update_monthly_expense(user_service):
+    queryset = UserMonthlyExpense.objects.filter(
+        user=user_service.user_id,
+        month=user_service.start_date.replace(day=1),
+        category=user_service.service.category_id
+    )
+    values = {
+        'expense': F('expense') + user_service.expense,
+        'cashback': F('cashback') + user_service.cashback
+    }
+    if queryset.update(**values):
+        return
+    try:
+        with transaction.atomic():
+            UserMonthlyExpense.objects.create(
+                user_id=user_service.user_id,
+                month=user_service.start_date.replace(day=1),
+                category_id=user_service.service.category_id,
+                expense=user_service.expense,
+                cashback=user_service.cashback
+            )
+    except IntegrityError:
+        queryset.update(**values)
+
+
+@transaction.atomic
+def connect_trial_period(object, days, user, phone_number):
+    user_service = UserService.objects.create(
+        user=user,
+        service=object.service,
+        tariff=object,
+        start_date=datetime.now().date(),
+        end_date=datetime.now().date() + timedelta(days=days),
+        renew_at=get_renew_at(datetime.now().date() + timedelta(days=days)),
+        expense=object.tariff_trial_period.price,
+        cashback=0,
+        is_active=True,
+        auto_pay=True,
+        status_cashback=False,
+        phone_number=phone_number,
+        condition=TRIAL_PERIOD,
+        condition_count=object.tariff_trial_period.count,
+        condition_period=object.tariff_trial_period.period
+    )
+    UserTrialPeriod.objects.create(
+        user=user,
+        service=object.service,
+        start_date=datetime.now().date(),
+        end_date=datetime.now().date() + timedelta(days=days)
+    )
+    update_subscribers_count(object.service, 1)
+    update_monthly_expense(user_service)
+    return user_service
+
+
+@transaction.atomic
 def connect_special_condition(object, days, user=None, phone_number=None):
     user_service = UserService.objects.create(
         user=user,
@@ -83,12 +162,16 @@ def connect_special_condition(object, days, user=None, phone_number=None):
         tariff=object,
         start_date=datetime.now().date(),
         end_date=datetime.now().date() + timedelta(days=days),
+        renew_at=get_renew_at(datetime.now().date() + timedelta(days=days)),
         expense=object.tariff_special_condition.price,
         cashback=0,
         is_active=True,
         auto_pay=True,
         status_cashback=False,
-        phone_number=phone_number
+        phone_number=phone_number,
+        condition=SPECIAL_CONDITION,
+        condition_count=object.tariff_special_condition.count,
+        condition_period=object.tariff_special_condition.period
     )
     UserSpecialCondition.objects.create(
         user=user,
@@ -96,9 +179,12 @@ def connect_special_condition(object, days, user=None, phone_number=None):
         start_date=datetime.now().date(),
         end_date=datetime.now().date() + timedelta(days=days)
     )
+    update_subscribers_count(object.service, 1)
+    update_monthly_expense(user_service)
     return user_service
 
 
+@transaction.atomic
 def create_subscribe(object, days, user, phone_number):
     price = object.tariff_condition.price
     cashback = object.service.cashback
@@ -108,11 +194,117 @@ def create_subscribe(object, days, user, phone_number):
         tariff=object,
         start_date=datetime.now().date(),
         end_date=datetime.now().date() + timedelta(days=days),
+        renew_at=get_renew_at(datetime.now().date() + timedelta(days=days)),
         expense=object.tariff_condition.price,
         cashback=floor(price * cashback / 100),
         is_active=True,
         auto_pay=True,
         status_cashback=False,
-        phone_number=phone_number
+        phone_number=phone_number,
+        condition=CONDITION,
+        condition_count=object.tariff_condition.count,
+        condition_period=object.tariff_condition.period
     )
+    update_subscribers_count(object.service, 1)
+    update_monthly_expense(subscribe)
     return subscribe
+
+
+def get_subscribe_plan(tariff, user, trial=True):
+    if trial and TariffTrialPeriod.objects.filter(
+        tariff=tariff
+    ).exists() and not UserTrialPeriod.objects.filter(
+        user=user,
+        service=tariff.service
+    ).exists():
+        return tariff.tariff_trial_period, connect_trial_period
+    if TariffSpecialCondition.objects.filter(
+        tariff=tariff
+    ).exists() and not UserSpecialCondition.objects.filter(
+        user=user,
+        tariff=tariff
+    ).exists():
+        return tariff.tariff_special_condition, connect_special_condition
+    return tariff.tariff_condition, create_subscribe
+
+
+def lock_user(user):
+    return User.objects.select_for_update().get(pk=user.pk)
+
+
+def get_duplicate_subscriptions(user, tariff, phone_number, resume=False):
+    subscriptions = UserService.objects.filter(user=user, tariff=tariff)
+    if resume:
+        return subscriptions.filter(is_active=True, auto_pay=True)
+    return subscriptions.filter(phone_number=phone_number)
+
+
+def is_duplicate_subscription(user, tariff, phone_number, resume=False,
+                              created_before=None):
+    orders = SubscriptionOrder.objects.filter(
+        user=user,
+        tariff=tariff,
+        phone_number=phone_number,
+        status=PENDING
+    )
+    if created_before is not None:
+        orders = orders.filter(created__lt=created_before)
+    return get_duplicate_subscriptions(
+        user,
+        tariff,
+        phone_number,
+        resume
+    ).exists() or orders.exists()
+
+
+def pay_subscription(tariff, user, phone_number, key=None, trial=True):
+    condition, connect = get_subscribe_plan(tariff, user, trial)
+    paid = bank_client.payment(
+        user,
+        condition.price,
+        key or get_subscribe_key(user, tariff, phone_number)
+    )
+    if paid is None:
+        raise PaymentUnavailable
+    if not paid:
+        return None
+    return condition, connect
+
+
+@transaction.atomic
+def apply_subscription(plan, tariff, user, phone_number, resume=False):
+    lock_user(user)
+    if get_duplicate_subscriptions(
+        user,
+        tariff,
+        phone_number,
+        resume
+    ).exists():
+        return None
+    condition, connect = plan
+    return connect(
+        object=tariff,
+        days=get_days(condition),
+        user=user,
+        phone_number=phone_number
+    )
+
+
+def subscribe(tariff, user, phone_number, key=None, resume=False):
+    with transaction.atomic():
+        lock_user(user)
+        if is_duplicate_subscription(user, tariff, phone_number, resume):
+            raise SubscriptionExists
+    plan = pay_subscription(tariff, user, phone_number, key, not resume)
+    if plan is None:
+        raise PaymentError
+    subscription = apply_subscription(
+        plan,
+        tariff,
+        user,
+        phone_number,
+        resume
+    )
+    if subscription is None:
+        raise SubscriptionExists
+    return subscription
@@ -14,8 +14,24 @@ app.conf.beat_schedule = {
         'task': 'users.tasks.cashback_accrual',
         'schedule': crontab(0, 0, day_of_month='25'),
     },
-    'autopay_every_day': {
+    'autopay_every_ten_minutes': {
         'task': 'users.tasks.create_autopay',
-        'schedule': crontab(minute=0, hour=0),
+        'schedule': crontab(minute='*/10'),
+    },
+    'retry_subscription_orders_every_ten_minutes': {
+        'task': 'users.tasks.retry_subscription_orders',
+        'schedule': crontab(minute='*/10'),
+    },
+    'reconcile_subscribers_count_every_day': {
+        'task': 'users.tasks.reconcile_subscribers_count',
+        'schedule': crontab(minute=0, hour=3),
+    },
+    'reconcile_monthly_expenses_every_day': {
+        'task': 'users.tasks.reconcile_monthly_expenses',
+        'schedule': crontab(minute=30, hour=3),
+    },
+    'build_charge_projection_every_day': {
+        'task': 'users.tasks.build_charge_projection',
+        'schedule': crontab(minute=0, hour=4),
     }
 }
@@ -18,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'djoser',
     'django_filters',
@@ -140,3 +141,33 @@ SWAGGER_SETTINGS = {
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379')
 CELERY_RESULT_BACKEND = os.getenv(
     'CELERY_RESULT_BACKEND', 'redis://localhost:6379')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://localhost:6379/2'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': 0.1,
+            'SOCKET_TIMEOUT': 0.1,
+            'IGNORE_EXCEPTIONS': True,
+        },
+    }
+}
+
+CATALOG_CACHE = {
+    'LOCATION': os.getenv('CATALOG_CACHE_URL', 'redis://localhost:6379/1'),
+    'TIMEOUT': 300,
+    'MAX_ENTRIES': 1024,
+    'SOCKET_TIMEOUT': 0.1,
+    'RETRY_TIMEOUT': 5,
+}
+
+BANK_CLIENT = {
+    'BACKEND': os.getenv('BANK_CLIENT_BACKEND', 'http'),
+    'CONNECT_TIMEOUT': 1,
+    'READ_TIMEOUT': 5,
+    'RETRIES': 3,
+    'BACKOFF': 0.2,
+    'POOL_SIZE': 10,
+    'BATCH_SIZE': 100,
+}
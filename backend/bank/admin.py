@@ -0,0 +1,19 @@
+from django.contrib import admin
+
+from .models import Payment
+
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('created', 'user', 'kind', 'price', 'key')
+    list_filter = ('kind',)
+    search_fields = ('user__email', 'key')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
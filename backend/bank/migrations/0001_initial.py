@@ -0,0 +1,37 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(blank=True, max_length=128, null=True, unique=True, verbose_name='Ключ идемпотентности')),
+                ('kind', models.CharField(choices=[('P', 'Платеж'), ('C', 'Кэшбек')], max_length=1, verbose_name='Тип')),
+                ('price', models.PositiveIntegerField(verbose_name='Сумма')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'платеж',
+                'verbose_name_plural': 'Платежи',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-created'], name='payment_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import models
+
+PAYMENT = 'P'
+CASHBACK = 'C'
+KINDS = (
+    (PAYMENT, 'Платеж'),
+    (CASHBACK, 'Кэшбек'),
+)
+
+
+class Payment(models.Model):
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=128,
+        unique=True,
+        null=True,
+        blank=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='payments'
+    )
+    kind = models.CharField(
+        'Тип',
+        max_length=1,
+        choices=KINDS
+    )
+    price = models.PositiveIntegerField(
+        'Сумма'
+    )
+    created = models.DateTimeField(
+        'Дата',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'платеж'
+        verbose_name_plural = 'Платежи'
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['user', '-created'],
+                name='payment_user_created_idx'
+            )
+        ]
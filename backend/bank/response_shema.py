@@ -37,3 +37,23 @@ response_schema_dict_cashback = {
         }
     ),
 }
+
+response_schema_dict_batch = {
+    "200": openapi.Response(
+        description="OK",
+        examples={
+            "application/json": {
+                "results": [
+                    {
+                        "user": "user@example.com",
+                        "success": True,
+                        "message": "Оплата прошла",
+                    }
+                ]
+            }
+        }
+    ),
+    "400": openapi.Response(
+        description="BAD REQUEST",
+    ),
+}
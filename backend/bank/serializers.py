@@ -0,0 +1,22 @@
+from rest_framework import serializers
+
+MAX_BATCH_SIZE = 1000
+
+
+class BatchItemSerializer(serializers.Serializer):
+    user = serializers.CharField()
+    price = serializers.IntegerField(min_value=0)
+    key = serializers.CharField(
+        max_length=128,
+        required=False,
+        allow_null=True,
+        allow_blank=True
+    )
+
+
+class BatchSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=BatchItemSerializer(),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from .views import cashback_accrual, payment
+from .views import (cashback_accrual, cashback_accrual_batch, payment,
+                    payment_batch)
 
 app_name = 'bank'
 
@@ -14,5 +15,15 @@ urlpatterns = [
         'cashback_accrual/',
         cashback_accrual,
         name='cashback_accrual'
+    ),
+    path(
+        'payment/batch/',
+        payment_batch,
+        name='payment_batch'
+    ),
+    path(
+        'cashback_accrual/batch/',
+        cashback_accrual_batch,
+        name='cashback_accrual_batch'
     )
 ]
@@ -6,10 +6,98 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from .response_shema import response_schema_dict, response_schema_dict_cashback
+from .models import CASHBACK, PAYMENT, Payment
+from .response_shema import (response_schema_dict, response_schema_dict_batch,
+                             response_schema_dict_cashback)
+from .serializers import MAX_BATCH_SIZE, BatchItemSerializer, BatchSerializer
 
 User = get_user_model()
 
+batch_request_body = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'items': openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            max_items=MAX_BATCH_SIZE,
+            items=openapi.Items(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'user': openapi.Schema(
+                        type=openapi.TYPE_STRING,
+                    ),
+                    'price': openapi.Schema(
+                        type=openapi.TYPE_INTEGER
+                    ),
+                    'key': openapi.Schema(
+                        type=openapi.TYPE_STRING
+                    )
+                }
+            )
+        )
+    }
+)
+
+
+def settle(items, kind):
+    settled = set(Payment.objects.filter(
+        key__in={item['key'] for item in items if item.get('key')}
+    ).values_list('key', flat=True))
+    users = dict(User.objects.filter(
+        email__in={item['user'] for item in items}
+    ).values_list('email', 'id'))
+    payments = []
+    results = []
+    for item in items:
+        key = item.get('key') or None
+        if key not in settled:
+            if item['user'] not in users:
+                results.append(False)
+                continue
+            payments.append(Payment(
+                key=key,
+                user_id=users[item['user']],
+                kind=kind,
+                price=item['price']
+            ))
+            if key:
+                settled.add(key)
+        results.append(True)
+    Payment.objects.bulk_create(payments, ignore_conflicts=True)
+    return results
+
+
+def settle_one(request, kind, success_message, error_message):
+    serializer = BatchItemSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    if settle([serializer.validated_data], kind)[0]:
+        return Response(
+            {'message': success_message},
+            status=status.HTTP_200_OK
+        )
+    return Response(
+        {'message': error_message},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def settle_batch(request, kind, success_message, error_message):
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data['items']
+    return Response(
+        {
+            'results': [
+                {
+                    'user': item['user'],
+                    'success': success,
+                    'message': success_message if success else error_message
+                }
+                for item, success in zip(items, settle(items, kind))
+            ]
+        },
+        status=status.HTTP_200_OK
+    )
+
 
 @swagger_auto_schema(
     method='post',
@@ -24,6 +112,9 @@ User = get_user_model()
             ),
             'price': openapi.Schema(
                 type=openapi.TYPE_INTEGER
+            ),
+            'key': openapi.Schema(
+                type=openapi.TYPE_STRING
             )
         }
     ),
@@ -32,15 +123,7 @@ User = get_user_model()
 @api_view(['POST'])
 @permission_classes((AllowAny, ))
 def payment(request):
-    if User.objects.filter(email=request.data['user']).exists():
-        return Response(
-            {'message': 'Оплата прошла'},
-            status=status.HTTP_200_OK
-        )
-    return Response(
-        {'message': 'Оплата не прошла'},
-        status=status.HTTP_400_BAD_REQUEST
-    )
+    return settle_one(request, PAYMENT, 'Оплата прошла', 'Оплата не прошла')
 
 
 @swagger_auto_schema(
@@ -56,6 +139,9 @@ def payment(request):
             ),
             'price': openapi.Schema(
                 type=openapi.TYPE_INTEGER
+            ),
+            'key': openapi.Schema(
+                type=openapi.TYPE_STRING
             )
         }
     ),
@@ -64,12 +150,51 @@ def payment(request):
 @api_view(['POST'])
 @permission_classes((AllowAny, ))
 def cashback_accrual(request):
-    if User.objects.filter(email=request.data['user']).exists():
-        return Response(
-            {'message': 'Кэшбек начислен'},
-            status=status.HTTP_200_OK
-        )
-    return Response(
-        {'message': 'Кэшбек не зачислен'},
-        status=status.HTTP_400_BAD_REQUEST
+    return settle_one(
+        request,
+        CASHBACK,
+        'Кэшбек начислен',
+        'Кэшбек не зачислен'
+    )
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_description=(
+        'Совершение нескольких платежей одним запросом. '
+        f'Не больше {MAX_BATCH_SIZE} платежей, '
+        'результат возвращается для каждого платежа.'
+    ),
+    request_body=batch_request_body,
+    responses=response_schema_dict_batch
+)
+@api_view(['POST'])
+@permission_classes((AllowAny, ))
+def payment_batch(request):
+    return settle_batch(
+        request,
+        PAYMENT,
+        'Оплата прошла',
+        'Оплата не прошла'
+    )
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_description=(
+        'Начисление кэшбека нескольким пользователям одним запросом. '
+        f'Не больше {MAX_BATCH_SIZE} начислений, '
+        'результат возвращается для каждого начисления.'
+    ),
+    request_body=batch_request_body,
+    responses=response_schema_dict_batch
+)
+@api_view(['POST'])
+@permission_classes((AllowAny, ))
+def cashback_accrual_batch(request):
+    return settle_batch(
+        request,
+        CASHBACK,
+        'Кэшбек начислен',
+        'Кэшбек не зачислен'
     )
@@ -0,0 +1,136 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from time import monotonic, sleep
+
+from django.conf import settings
+from redis import Redis, RedisError
+
+
+class CatalogCache:
+    version_key = 'catalog:version'
+    channel = 'catalog:invalidate'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.entries = OrderedDict()
+        self.client = None
+        self.version = None
+        self.retry_at = 0
+        self.listener = None
+
+    @property
+    def options(self):
+        return settings.CATALOG_CACHE
+
+    def get_client(self):
+        if monotonic() < self.retry_at:
+            return None
+        if self.client is None:
+            self.client = Redis.from_url(
+                self.options['LOCATION'],
+                socket_timeout=self.options['SOCKET_TIMEOUT'],
+                socket_connect_timeout=self.options['SOCKET_TIMEOUT']
+            )
+        return self.client
+
+    def call_redis(self, method, *args, **kwargs):
+        client = self.get_client()
+        if client is None:
+            return None
+        try:
+            return getattr(client, method)(*args, **kwargs)
+        except RedisError:
+            self.retry_at = monotonic() + self.options['RETRY_TIMEOUT']
+            return None
+
+    def start_listener(self):
+        if os.getpid() != self.pid:
+            self.reset()
+        if self.listener is None:
+            self.listener = threading.Thread(target=self.listen, daemon=True)
+            self.listener.start()
+
+    def listen(self):
+        client = Redis.from_url(self.options['LOCATION'])
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.version = None
+                self.clear_local()
+                for message in pubsub.listen():
+                    self.version = int(message['data'])
+                    self.clear_local()
+            except RedisError:
+                sleep(self.options['RETRY_TIMEOUT'])
+
+    def get_redis_key(self, key, local=True):
+        if self.version is None or not local:
+            version = self.call_redis('get', self.version_key)
+            if version is None and monotonic() < self.retry_at:
+                return None
+            self.version = int(version or 0)
+        return f'catalog:{self.version}:{key}'
+
+    def get(self, key, local=True):
+        self.start_listener()
+        with self.lock:
+            entry = self.entries.get(key) if local else None
+            if entry is not None and entry[0] > monotonic():
+                self.entries.move_to_end(key)
+                return entry[1]
+        redis_key = self.get_redis_key(key, local)
+        if redis_key is None:
+            return None
+        data = self.call_redis('get', redis_key)
+        if data is None:
+            return None
+        value = pickle.loads(data)
+        if local:
+            self.set_local(key, value)
+        return value
+
+    def set(self, key, value, local=True):
+        if local:
+            self.set_local(key, value)
+        redis_key = self.get_redis_key(key, local)
+        if redis_key is not None:
+            self.call_redis(
+                'set',
+                redis_key,
+                pickle.dumps(value),
+                ex=self.options['TIMEOUT']
+            )
+
+    def set_local(self, key, value):
+        with self.lock:
+            self.entries[key] = (monotonic() + self.options['TIMEOUT'], value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.options['MAX_ENTRIES']:
+                self.entries.popitem(last=False)
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def clear_local(self):
+        with self.lock:
+            self.entries.clear()
+        for callback in self.callbacks:
+            callback()
+
+    def clear(self):
+        self.clear_local()
+        version = self.call_redis('incr', self.version_key)
+        if version is not None:
+            self.version = version
+            self.call_redis('publish', self.channel, version)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_subscribers(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    UserService = apps.get_model('users', 'UserService')
+    counts = UserService.objects.filter(
+        is_active=True,
+        auto_pay=True
+    ).values('service').annotate(count=Count('id')).values_list(
+        'service',
+        'count'
+    )
+    for service, count in counts:
+        Service.objects.filter(pk=service).update(subscribers_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+        ('users', '0004_user_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Количество активных подписок'),
+        ),
+        migrations.RunPython(count_subscribers, migrations.RunPython.noop),
+    ]
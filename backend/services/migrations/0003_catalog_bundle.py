@@ -0,0 +1,26 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_service_subscribers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64, verbose_name='Версия каталога')),
+                ('content', models.BinaryField(verbose_name='Каталог в формате JSON, сжатый gzip')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'выгрузка каталога',
+                'verbose_name_plural': 'Выгрузки каталога',
+            },
+        ),
+    ]
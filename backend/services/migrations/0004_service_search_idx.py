@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_catalog_bundle'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', 'full_name', 'short_description', config='russian'), name='service_search_idx'),
+        ),
+    ]
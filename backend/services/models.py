@@ -1,5 +1,7 @@
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -78,10 +80,27 @@ class Service(models.Model):
     url = models.URLField(
         'Ссылка на сервис'
     )
+    subscribers_count = models.PositiveIntegerField(
+        'Количество активных подписок',
+        default=0,
+        editable=False,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'сервис'
         verbose_name_plural = 'Сервисы'
+        indexes = [
+            GinIndex(
+                SearchVector(
+                    'name',
+                    'full_name',
+                    'short_description',
+                    config='russian'
+                ),
+                name='service_search_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -242,3 +261,21 @@ class ServiceCategoryImage(models.Model):
     class Meta:
         verbose_name = 'изображение для сервиса'
         verbose_name_plural = 'Изображения для сервиса'
+
+
+class CatalogBundle(models.Model):
+    version = models.CharField(
+        'Версия каталога',
+        max_length=64
+    )
+    content = models.BinaryField(
+        'Каталог в формате JSON, сжатый gzip'
+    )
+    updated = models.DateTimeField(
+        'Дата обновления',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'выгрузка каталога'
+        verbose_name_plural = 'Выгрузки каталога'
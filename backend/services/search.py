@@ -0,0 +1,94 @@
+import re
+import threading
+from bisect import bisect_left
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db.models import F
+
+from .cache import catalog_cache
+from .models import Service
+
+SEARCH_CONFIG = 'russian'
+
+
+def get_search_vector():
+    return SearchVector(
+        'name',
+        'full_name',
+        'short_description',
+        config=SEARCH_CONFIG
+    )
+
+
+def get_words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_services(text):
+    words = get_words(text)
+    if not words:
+        return Service.objects.none()
+    query = SearchQuery(
+        ' & '.join(f'{word}:*' for word in words),
+        config=SEARCH_CONFIG,
+        search_type='raw'
+    )
+    return Service.objects.annotate(
+        search=get_search_vector()
+    ).filter(
+        search=query
+    ).annotate(
+        rank=SearchRank(F('search'), query)
+    ).order_by('-rank', 'name')
+
+
+class ServicePrefixIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+        self.generation = 0
+        catalog_cache.connect(self.clear)
+
+    def build(self):
+        entries = set()
+        for pk, name, full_name in Service.objects.values_list(
+            'id',
+            'name',
+            'full_name'
+        ):
+            for title in (name, full_name):
+                words = get_words(title)
+                entries.add((' '.join(words), name, str(pk)))
+                entries.update((word, name, str(pk)) for word in words)
+        return sorted(entries)
+
+    def search(self, text, limit=10):
+        entries = self.entries
+        if entries is None:
+            catalog_cache.start_listener()
+            generation = self.generation
+            entries = self.build()
+            with self.lock:
+                if self.generation == generation:
+                    self.entries = entries
+        prefix = ' '.join(get_words(text))
+        if not prefix:
+            return []
+        results = {}
+        index = bisect_left(entries, (prefix,))
+        while (index < len(entries) and len(results) < limit
+               and entries[index][0].startswith(prefix)):
+            _, name, pk = entries[index]
+            results.setdefault(pk, name)
+            index += 1
+        return [{'id': pk, 'name': name} for pk, name in results.items()]
+
+    def clear(self):
+        with self.lock:
+            self.entries = None
+            self.generation += 1
+
+
+service_prefix_index = ServicePrefixIndex()
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .cache import catalog_cache
+from .models import (CategoryImage, CategoryService, Service,
+                     ServiceCategoryImage, Tariff, TariffCondition,
+                     TariffSpecialCondition, TariffTrialPeriod)
+
+catalog_committed = Signal()
+
+
+@receiver((post_save, post_delete), sender=CategoryService)
+@receiver((post_save, post_delete), sender=Service)
+@receiver((post_save, post_delete), sender=Tariff)
+@receiver((post_save, post_delete), sender=TariffTrialPeriod)
+@receiver((post_save, post_delete), sender=TariffCondition)
+@receiver((post_save, post_delete), sender=TariffSpecialCondition)
+@receiver((post_save, post_delete), sender=CategoryImage)
+@receiver((post_save, post_delete), sender=ServiceCategoryImage)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(catalog_cache.clear)
+    transaction.on_commit(lambda: catalog_committed.send(sender=sender))
@@ -1,11 +1,19 @@
 from django.contrib import admin
 
-from .models import UserService, UserSpecialCondition, UserTrialPeriod
+from api_v1.utils import get_renew_at
+
+from .models import (CashbackAccrual, CashbackAccrualChunk, ChargeProjection,
+                     SubscriptionOrder, UserService, UserSpecialCondition,
+                     UserTrialPeriod)
 
 
 @admin.register(UserService)
 class UserServiceAdmin(admin.ModelAdmin):
-    pass
+
+    def save_model(self, request, obj, form, change):
+        if 'end_date' in form.changed_data:
+            obj.renew_at = get_renew_at(obj.end_date)
+        super().save_model(request, obj, form, change)
 
 
 @admin.register(UserTrialPeriod)
@@ -16,3 +24,54 @@ class UserTrialPeriodAdmin(admin.ModelAdmin):
 @admin.register(UserSpecialCondition)
 class UserSpecialConditionAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(ChargeProjection)
+class ChargeProjectionAdmin(admin.ModelAdmin):
+    list_display = (
+        'date', 'service', 'category', 'renewals', 'charges', 'cashback'
+    )
+    list_filter = ('category', 'service')
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class CashbackAccrualChunkInline(admin.TabularInline):
+    model = CashbackAccrualChunk
+    fields = (
+        'first_id', 'last_id', 'processed', 'accrued', 'failed', 'finished'
+    )
+    readonly_fields = fields
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CashbackAccrual)
+class CashbackAccrualAdmin(admin.ModelAdmin):
+    list_display = ('month', 'accrued', 'failed', 'updated')
+    inlines = (CashbackAccrualChunkInline,)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SubscriptionOrder)
+class SubscriptionOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'tariff', 'status', 'created', 'updated')
+    list_filter = ('status',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from django.conf import settings
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .utils import get_full_url
+
+
+def get_renewal_key(subscription):
+    return f'renewal:{subscription.pk}:{subscription.end_date}'
+
+
+def get_cashback_key(subscription):
+    return f'cashback:{subscription.pk}'
+
+
+def get_subscribe_key(user, tariff, phone_number):
+    return f'subscription:{user.pk}:{tariff.pk}:{phone_number}'
+
+
+class BankBatchError(Exception):
+    pass
+
+
+class HttpBankBackend:
+
+    def __init__(self, options):
+        self.options = options
+        self.pid = None
+        self.session = None
+
+    def get_session(self):
+        if self.session is None or self.pid != os.getpid():
+            retry = Retry(
+                total=self.options['RETRIES'],
+                connect=self.options['RETRIES'],
+                read=0,
+                status=self.options['RETRIES'],
+                status_forcelist=(502, 503, 504),
+                backoff_factor=self.options['BACKOFF']
+            )
+            adapter = HTTPAdapter(
+                pool_maxsize=self.options['POOL_SIZE'],
+                max_retries=retry
+            )
+            self.session = Session()
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self.pid = os.getpid()
+        return self.session
+
+    def post(self, path, data):
+        return self.get_session().post(
+            get_full_url(path),
+            data=data,
+            timeout=(
+                self.options['CONNECT_TIMEOUT'],
+                self.options['READ_TIMEOUT']
+            )
+        ).status_code
+
+    def post_batch(self, path, items):
+        response = self.get_session().post(
+            get_full_url(f'{path}batch/'),
+            json={'items': items},
+            timeout=(
+                self.options['CONNECT_TIMEOUT'],
+                self.options['READ_TIMEOUT']
+            )
+        )
+        if 400 <= response.status_code < 500:
+            return [False] * len(items)
+        response.raise_for_status()
+        return [result['success'] for result in response.json()['results']]
+
+
+class LocalBankBackend:
+
+    def __init__(self, options=None):
+        self.calls = []
+        self.status_codes = []
+        self.keys = set()
+
+    def post(self, path, data):
+        if data.get('key') in self.keys:
+            return 200
+        self.calls.append((path, data))
+        status_code = self.status_codes.pop(0) if self.status_codes else 200
+        if status_code == 200 and data.get('key'):
+            self.keys.add(data['key'])
+        return status_code
+
+    def post_batch(self, path, items):
+        return [self.post(path, item) == 200 for item in items]
+
+
+class BankClient:
+    backends = {
+        'http': HttpBankBackend,
+        'local': LocalBankBackend,
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backend = None
+        self.stats = {}
+
+    def get_backend(self):
+        if self.backend is None:
+            options = settings.BANK_CLIENT
+            self.backend = self.backends[options['BACKEND']](options)
+        return self.backend
+
+    def record(self, path, started, error):
+        elapsed = monotonic() - started
+        with self.lock:
+            stats = self.stats.setdefault(path, {
+                'requests': 0,
+                'errors': 0,
+                'latency': 0,
+                'max_latency': 0
+            })
+            stats['requests'] += 1
+            stats['errors'] += error
+            stats['latency'] += elapsed
+            stats['max_latency'] = max(stats['max_latency'], elapsed)
+
+    def post(self, path, data):
+        started = monotonic()
+        try:
+            status_code = self.get_backend().post(path, data)
+        except RequestException:
+            status_code = None
+        self.record(path, started, status_code != 200)
+        if status_code is None or status_code >= 500:
+            return None
+        return status_code == 200
+
+    def post_batch(self, path, items):
+        started = monotonic()
+        try:
+            results = self.get_backend().post_batch(path, items)
+        except (RequestException, ValueError, KeyError):
+            results = None
+        self.record(f'{path}batch/', started, results is None)
+        if results is None:
+            return [None] * len(items)
+        if len(results) != len(items):
+            raise BankBatchError(
+                f'{path}batch/: {len(results)} results for {len(items)} items'
+            )
+        return results
+
+    def post_many(self, path, items):
+        items = [
+            {'user': str(user), 'price': price, 'key': key}
+            for user, price, key in items
+        ]
+        size = settings.BANK_CLIENT['BATCH_SIZE']
+        results = asyncio.run(self.gather(path, [
+            items[index:index + size]
+            for index in range(0, len(items), size)
+        ]))
+        return [success for batch in results for success in batch]
+
+    async def gather(self, path, batches):
+        concurrency = settings.BANK_CLIENT['POOL_SIZE']
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def send(executor, batch):
+            async with semaphore:
+                return await loop.run_in_executor(
+                    executor,
+                    self.post_batch,
+                    path,
+                    batch
+                )
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return await asyncio.gather(*(
+                send(executor, batch) for batch in batches
+            ))
+
+    def payment(self, user, price, key=None):
+        return self.post(
+            'payment/',
+            {'user': str(user), 'price': price, 'key': key}
+        )
+
+    def cashback_accrual(self, user, price, key=None):
+        return self.post(
+            'cashback_accrual/',
+            {'user': str(user), 'price': price, 'key': key}
+        )
+
+    def payment_many(self, items):
+        return self.post_many('payment/', items)
+
+    def cashback_accrual_many(self, items):
+        return self.post_many('cashback_accrual/', items)
+
+
+bank_client = BankClient()
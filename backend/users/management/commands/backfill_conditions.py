@@ -0,0 +1,48 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand
+
+from api_v1.utils import (get_condition_kind, get_tariff_condition,
+                          get_user_conditions)
+from users.models import UserService
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет условие тарифа в подписках, созданных до его появления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = UserService.objects.filter(
+            condition=''
+        ).select_related(
+            'tariff__tariff_condition',
+            'tariff__tariff_special_condition',
+            'tariff__tariff_trial_period'
+        ).order_by('pk')
+        updated = 0
+        batch = list(queryset[:options['batch_size']])
+        while batch:
+            conditions = get_user_conditions(batch)
+            subscriptions = []
+            for subscription in batch:
+                subscription.condition = get_condition_kind(
+                    subscription,
+                    conditions
+                )
+                try:
+                    condition = get_tariff_condition(subscription)
+                except ObjectDoesNotExist:
+                    continue
+                subscription.condition_count = condition.count
+                subscription.condition_period = condition.period
+                subscriptions.append(subscription)
+            UserService.objects.bulk_update(
+                subscriptions,
+                ('condition', 'condition_count', 'condition_period')
+            )
+            updated += len(subscriptions)
+            batch = list(
+                queryset.filter(pk__gt=batch[-1].pk)[:options['batch_size']]
+            )
+        self.stdout.write(f'Обновлено подписок: {updated}')
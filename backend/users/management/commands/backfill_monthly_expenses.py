@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.tasks import reconcile_monthly_expenses
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает расходы пользователей по месяцам и категориям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = reconcile_monthly_expenses(options['batch_size'])
+        self.stdout.write(f'Обновлено пользователей: {updated}')
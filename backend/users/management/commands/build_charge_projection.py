@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.tasks import build_charge_projection
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает прогноз списаний и кэшбека по сервисам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+
+    def handle(self, *args, **options):
+        created = build_charge_projection(options['days'])
+        self.stdout.write(f'Создано записей: {created}')
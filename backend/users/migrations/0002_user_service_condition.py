@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userservice',
+            name='condition',
+            field=models.CharField(blank=True, choices=[('T', 'Trial period'), ('S', 'Special condition'), ('C', 'Condition')], max_length=1, verbose_name='Условие тарифа'),
+        ),
+        migrations.AddField(
+            model_name='userservice',
+            name='condition_count',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Количество дней/месяцев/лет'),
+        ),
+        migrations.AddField(
+            model_name='userservice',
+            name='condition_period',
+            field=models.CharField(blank=True, choices=[('D', 'Day'), ('M', 'Month'), ('Y', 'Year')], max_length=250, verbose_name='Период (день, месяц, год)'),
+        ),
+    ]
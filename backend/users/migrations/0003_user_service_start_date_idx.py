@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_service_condition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userservice',
+            index=models.Index(fields=['user', 'start_date', 'id'], name='user_service_start_date_idx'),
+        ),
+    ]
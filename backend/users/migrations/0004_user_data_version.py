@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_service_start_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия данных пользователя'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_service_search_idx'),
+        ('users', '0004_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMonthlyExpense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('expense', models.PositiveIntegerField(default=0, verbose_name='Сумма')),
+                ('cashback', models.PositiveIntegerField(default=0, verbose_name='Кэшбек')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_expenses', to='services.categoryservice', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_expenses', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'расходы пользователя за месяц',
+                'verbose_name_plural': 'Расходы пользователя по месяцам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usermonthlyexpense',
+            constraint=models.UniqueConstraint(fields=('user', 'month', 'category'), name='unique_user_month_category'),
+        ),
+    ]
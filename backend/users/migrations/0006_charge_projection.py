@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_service_search_idx'),
+        ('users', '0005_user_monthly_expense'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChargeProjection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата списания')),
+                ('renewals', models.PositiveIntegerField(verbose_name='Количество продлений')),
+                ('charges', models.PositiveBigIntegerField(verbose_name='Сумма списаний')),
+                ('cashback', models.PositiveBigIntegerField(verbose_name='Сумма кэшбека')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='charge_projections', to='services.categoryservice', verbose_name='Категория')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='charge_projections', to='services.service', verbose_name='Сервис')),
+            ],
+            options={
+                'verbose_name': 'прогноз списаний',
+                'verbose_name_plural': 'Прогноз списаний',
+                'ordering': ('date', 'service'),
+            },
+        ),
+    ]
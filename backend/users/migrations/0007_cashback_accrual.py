@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_charge_projection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashbackAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('accrued', models.PositiveIntegerField(default=0, verbose_name='Начислено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Не начислено')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'начисление кэшбека',
+                'verbose_name_plural': 'Начисления кэшбека',
+                'ordering': ('-month',),
+            },
+        ),
+    ]
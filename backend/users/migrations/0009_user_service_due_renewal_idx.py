@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_cashback_accrual'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userservice',
+            index=models.Index(condition=models.Q(('auto_pay', True), ('is_active', True)), fields=['end_date'], name='user_service_due_renewal_idx'),
+        ),
+    ]
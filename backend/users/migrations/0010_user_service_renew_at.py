@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_user_service_due_renewal_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userservice',
+            name='renew_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Время продления'),
+        ),
+        migrations.AddIndex(
+            model_name='userservice',
+            index=models.Index(condition=models.Q(('auto_pay', True), ('is_active', True)), fields=['renew_at'], name='user_service_renew_at_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_service_search_idx'),
+        ('users', '0010_user_service_renew_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionOrder',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('phone_number', models.CharField(max_length=16, verbose_name='Номер телефона')),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('S', 'Succeeded'), ('F', 'Failed')], default='P', max_length=1, verbose_name='Статус')),
+                ('key', models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Ключ идемпотентности')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resume_orders', to='users.userservice', verbose_name='Возобновляемая подписка')),
+                ('subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.userservice', verbose_name='Подписка')),
+                ('tariff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscription_orders', to='services.tariff', verbose_name='Тариф')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscription_orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'заказ подписки',
+                'verbose_name_plural': 'Заказы подписок',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
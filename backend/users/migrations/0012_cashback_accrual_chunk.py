@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_subscription_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashbackAccrualChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.UUIDField(verbose_name='Первая подписка')),
+                ('last_id', models.UUIDField(verbose_name='Последняя подписка')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('accrued', models.PositiveIntegerField(default=0, verbose_name='Начислено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Не начислено')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('accrual', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='users.cashbackaccrual', verbose_name='Начисление')),
+            ],
+            options={
+                'verbose_name': 'часть начисления кэшбека',
+                'verbose_name_plural': 'Части начисления кэшбека',
+                'ordering': ('accrual', 'first_id'),
+            },
+        ),
+    ]
@@ -6,15 +6,36 @@ from django.core.validators import RegexValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from services.models import Service, Tariff
+from services.models import CHOICES, CategoryService, Service, Tariff
 
 from .managers import CustomUserManager
 
+TRIAL_PERIOD = 'T'
+SPECIAL_CONDITION = 'S'
+CONDITION = 'C'
+CONDITIONS = (
+    (TRIAL_PERIOD, 'Trial period'),
+    (SPECIAL_CONDITION, 'Special condition'),
+    (CONDITION, 'Condition'),
+)
+PENDING = 'P'
+SUCCEEDED = 'S'
+FAILED = 'F'
+ORDER_STATUSES = (
+    (PENDING, 'Pending'),
+    (SUCCEEDED, 'Succeeded'),
+    (FAILED, 'Failed'),
+)
+
 
 class User(AbstractUser):
     username_validator = None
     username = None
     email = models.EmailField(_("email address"), unique=True)
+    data_version = models.PositiveIntegerField(
+        'Версия данных пользователя',
+        default=0
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
@@ -68,6 +89,12 @@ class UserService(models.Model):
         'Автоплатеж',
         default=True
     )
+    renew_at = models.DateTimeField(
+        'Время продления',
+        blank=True,
+        null=True,
+        editable=False
+    )
     phone_number = models.CharField(
         'Номер телефона',
         max_length=16,
@@ -77,10 +104,43 @@ class UserService(models.Model):
             )
         ]
     )
+    condition = models.CharField(
+        'Условие тарифа',
+        max_length=1,
+        choices=CONDITIONS,
+        blank=True
+    )
+    condition_count = models.PositiveSmallIntegerField(
+        'Количество дней/месяцев/лет',
+        blank=True,
+        null=True
+    )
+    condition_period = models.CharField(
+        'Период (день, месяц, год)',
+        max_length=250,
+        choices=CHOICES,
+        blank=True
+    )
 
     class Meta:
         verbose_name = 'подписка пользователя'
         verbose_name_plural = 'Подписки пользователя'
+        indexes = [
+            models.Index(
+                fields=['user', 'start_date', 'id'],
+                name='user_service_start_date_idx'
+            ),
+            models.Index(
+                fields=['end_date'],
+                name='user_service_due_renewal_idx',
+                condition=models.Q(is_active=True, auto_pay=True)
+            ),
+            models.Index(
+                fields=['renew_at'],
+                name='user_service_renew_at_idx',
+                condition=models.Q(is_active=True, auto_pay=True)
+            )
+        ]
 
     def clean(self):
         if self.start_date > self.end_date:
@@ -190,3 +250,203 @@ class UserSpecialCondition(models.Model):
                 }
             )
         return super().clean()
+
+
+class UserMonthlyExpense(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='monthly_expenses'
+    )
+    month = models.DateField(
+        'Месяц'
+    )
+    category = models.ForeignKey(
+        CategoryService,
+        on_delete=models.CASCADE,
+        verbose_name='Категория',
+        related_name='monthly_expenses'
+    )
+    expense = models.PositiveIntegerField(
+        'Сумма',
+        default=0
+    )
+    cashback = models.PositiveIntegerField(
+        'Кэшбек',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'расходы пользователя за месяц'
+        verbose_name_plural = 'Расходы пользователя по месяцам'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'month', 'category'],
+                name='unique_user_month_category'
+            )
+        ]
+
+
+class ChargeProjection(models.Model):
+    date = models.DateField(
+        'Дата списания'
+    )
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        verbose_name='Сервис',
+        related_name='charge_projections'
+    )
+    category = models.ForeignKey(
+        CategoryService,
+        on_delete=models.CASCADE,
+        verbose_name='Категория',
+        related_name='charge_projections'
+    )
+    renewals = models.PositiveIntegerField(
+        'Количество продлений'
+    )
+    charges = models.PositiveBigIntegerField(
+        'Сумма списаний'
+    )
+    cashback = models.PositiveBigIntegerField(
+        'Сумма кэшбека'
+    )
+    created = models.DateTimeField(
+        'Дата расчета',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'прогноз списаний'
+        verbose_name_plural = 'Прогноз списаний'
+        ordering = ('date', 'service')
+
+
+class CashbackAccrual(models.Model):
+    month = models.DateField(
+        'Месяц',
+        unique=True
+    )
+    accrued = models.PositiveIntegerField(
+        'Начислено',
+        default=0
+    )
+    failed = models.PositiveIntegerField(
+        'Не начислено',
+        default=0
+    )
+    updated = models.DateTimeField(
+        'Дата обновления',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'начисление кэшбека'
+        verbose_name_plural = 'Начисления кэшбека'
+        ordering = ('-month',)
+
+
+class CashbackAccrualChunk(models.Model):
+    accrual = models.ForeignKey(
+        CashbackAccrual,
+        on_delete=models.CASCADE,
+        verbose_name='Начисление',
+        related_name='chunks'
+    )
+    first_id = models.UUIDField(
+        'Первая подписка'
+    )
+    last_id = models.UUIDField(
+        'Последняя подписка'
+    )
+    processed = models.PositiveIntegerField(
+        'Обработано',
+        default=0
+    )
+    accrued = models.PositiveIntegerField(
+        'Начислено',
+        default=0
+    )
+    failed = models.PositiveIntegerField(
+        'Не начислено',
+        default=0
+    )
+    finished = models.DateTimeField(
+        'Дата завершения',
+        blank=True,
+        null=True
+    )
+
+    class Meta:
+        verbose_name = 'часть начисления кэшбека'
+        verbose_name_plural = 'Части начисления кэшбека'
+        ordering = ('accrual', 'first_id')
+
+
+class SubscriptionOrder(models.Model):
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='subscription_orders'
+    )
+    tariff = models.ForeignKey(
+        Tariff,
+        on_delete=models.CASCADE,
+        verbose_name='Тариф',
+        related_name='subscription_orders'
+    )
+    phone_number = models.CharField(
+        'Номер телефона',
+        max_length=16
+    )
+    source = models.ForeignKey(
+        UserService,
+        on_delete=models.CASCADE,
+        verbose_name='Возобновляемая подписка',
+        related_name='resume_orders',
+        blank=True,
+        null=True
+    )
+    subscription = models.ForeignKey(
+        UserService,
+        on_delete=models.SET_NULL,
+        verbose_name='Подписка',
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=1,
+        choices=ORDER_STATUSES,
+        default=PENDING
+    )
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=100,
+        unique=True,
+        blank=True,
+        null=True
+    )
+    created = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True
+    )
+    updated = models.DateTimeField(
+        'Дата обновления',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'заказ подписки'
+        verbose_name_plural = 'Заказы подписок'
+        ordering = ('-created',)
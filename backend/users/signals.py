@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserService, UserSpecialCondition, UserTrialPeriod
+from .utils import update_data_version
+
+
+@receiver((post_save, post_delete), sender=UserService)
+@receiver((post_save, post_delete), sender=UserTrialPeriod)
+@receiver((post_save, post_delete), sender=UserSpecialCondition)
+def user_data_changed(sender, instance, **kwargs):
+    update_data_version(instance.user_id)
@@ -1,94 +1,532 @@
-from datetime import datetime
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from math import ceil, floor
+from time import monotonic
 
-from requests import post
+from celery import chord
+from django.db import transaction
+from django.db.models import Count, DateField, F, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncMonth
+from django.utils import timezone
 
-from api_v1.exeptions import CashbackError, PaymentError
-from api_v1.utils import connect_special_condition, create_subscribe, get_days
+from api_v1.analytics import get_charges, get_next_condition
+from api_v1.exeptions import IdempotencyKeyConflict
+from api_v1.utils import (apply_subscription, connect_special_condition,
+                          create_subscribe, get_condition_kind, get_days,
+                          get_user_conditions, is_duplicate_subscription,
+                          pay_subscription, update_subscribers_count)
 from backend.celery import app
-from services.models import TariffSpecialCondition
+from services.models import Service, Tariff
 
-from .models import UserService, UserTrialPeriod
-from .utils import get_full_url
+from .bank_client import bank_client, get_cashback_key, get_renewal_key
+from .models import (CONDITION, FAILED, PENDING, SPECIAL_CONDITION, SUCCEEDED,
+                     CashbackAccrual, CashbackAccrualChunk, ChargeProjection,
+                     SubscriptionOrder, User, UserMonthlyExpense, UserService)
+from .utils import update_data_version
+
+logger = logging.getLogger(__name__)
+
+CLAIM_TIMEOUT = timedelta(minutes=30)
+RETRY_DELAY = timedelta(days=1)
+ORDER_RETRY_AFTER = timedelta(minutes=10)
+
+
+def get_pk_ranges(queryset, chunk_size):
+    ranges = []
+    pks = queryset.order_by('pk').values_list('pk', flat=True).iterator()
+    for index, pk in enumerate(pks):
+        if index % chunk_size == 0:
+            ranges.append([str(pk), str(pk)])
+        ranges[-1][1] = str(pk)
+    return ranges
 
 
 @app.task
-def cashback_accrual():
-    month = datetime.now().month - 1
-    year = datetime.now().year
-    subscriptions = UserService.objects.filter(
-        start_date__year=year,
-        start_date__month=month
+def summarize_chunks(results):
+    summary = {'chunks': len(results), 'slowest': 0}
+    for result in results:
+        for key, value in result.items():
+            summary[key] = summary.get(key, 0) + value
+        summary['slowest'] = max(summary['slowest'], result['elapsed'])
+    return summary
+
+
+def get_previous_month():
+    month = datetime.now().date().replace(day=1) - timedelta(days=1)
+    return month.replace(day=1)
+
+
+def get_cashback_queryset(month):
+    return UserService.objects.filter(
+        start_date__year=month.year,
+        start_date__month=month.month,
+        status_cashback=False
     )
-    for subscription in subscriptions:
-        url = get_full_url('cashback_accrual/')
-        response = post(
-            url,
-            data={
-                'user': subscription.user,
-                'price': subscription.cashback
-            }
+
+
+@app.task
+def cashback_accrual(chunk_size=500):
+    month = get_previous_month()
+    accrual, created = CashbackAccrual.objects.get_or_create(month=month)
+    chunks = CashbackAccrualChunk.objects.bulk_create(
+        CashbackAccrualChunk(accrual=accrual, first_id=first, last_id=last)
+        for first, last in get_pk_ranges(
+            get_cashback_queryset(month),
+            chunk_size
         )
-        if response.status_code != 200:
-            raise CashbackError
-        subscription.status_cashback = True
-        subscription.save()
+    )
+    if chunks:
+        chord(
+            accrue_cashback_chunk.s(chunk.pk) for chunk in chunks
+        )(finish_cashback_accrual.s(month.isoformat()))
+    return len(chunks)
 
 
 @app.task
-def create_autopay():
-    subscriptions = UserService.objects.filter(
+def accrue_cashback_chunk(chunk_id):
+    started = monotonic()
+    chunk = CashbackAccrualChunk.objects.select_related(
+        'accrual'
+    ).get(pk=chunk_id)
+    if chunk.finished is None:
+        accrue_cashback(chunk)
+    return {
+        'processed': chunk.processed,
+        'accrued': chunk.accrued,
+        'failed': chunk.failed,
+        'elapsed': monotonic() - started
+    }
+
+
+def accrue_cashback(chunk):
+    subscriptions = list(get_cashback_queryset(chunk.accrual.month).filter(
+        pk__range=(chunk.first_id, chunk.last_id)
+    ).select_related('user'))
+    payable = [
+        subscription for subscription in subscriptions
+        if subscription.cashback
+    ]
+    failed = {
+        subscription.pk
+        for subscription, success in zip(
+            payable,
+            bank_client.cashback_accrual_many(
+                (
+                    subscription.user,
+                    subscription.cashback,
+                    get_cashback_key(subscription)
+                )
+                for subscription in payable
+            )
+        )
+        if not success
+    }
+    accrued = [
+        subscription for subscription in subscriptions
+        if subscription.pk not in failed
+    ]
+    with transaction.atomic():
+        chunk.processed = len(subscriptions)
+        chunk.failed = len(failed)
+        chunk.accrued = UserService.objects.filter(
+            pk__in=[subscription.pk for subscription in accrued],
+            status_cashback=False
+        ).update(status_cashback=True)
+        chunk.finished = timezone.now()
+        chunk.save()
+        update_data_version(*{
+            subscription.user_id for subscription in accrued
+        })
+        CashbackAccrual.objects.filter(pk=chunk.accrual_id).update(
+            accrued=F('accrued') + chunk.accrued
+        )
+
+
+@app.task
+def finish_cashback_accrual(results, month):
+    month = date.fromisoformat(month)
+    CashbackAccrual.objects.filter(month=month).update(
+        failed=get_cashback_queryset(month).count()
+    )
+    return summarize_chunks(results)
+
+
+def get_autopay_queryset():
+    return UserService.objects.filter(
+        Q(renew_at__lte=timezone.now())
+        | Q(renew_at__isnull=True, end_date__lt=datetime.now().date()),
         is_active=True,
         auto_pay=True
     )
-    url = get_full_url('payment/')
+
+
+@app.task
+def create_autopay(workers=4, chunk_size=500):
+    workers = min(workers, ceil(get_autopay_queryset().count() / chunk_size))
+    if workers:
+        chord(
+            renew_due_subscriptions.s(chunk_size) for _ in range(workers)
+        )(summarize_chunks.s())
+    return workers
+
+
+def claim_due_subscriptions(chunk_size):
+    with transaction.atomic():
+        subscriptions = list(get_autopay_queryset().select_related(
+            'user',
+            'service',
+            'tariff__service',
+            'tariff__tariff_condition',
+            'tariff__tariff_special_condition'
+        ).select_for_update(
+            skip_locked=True,
+            of=('self',)
+        ).order_by('end_date')[:chunk_size])
+        UserService.objects.filter(
+            pk__in=[subscription.pk for subscription in subscriptions]
+        ).update(renew_at=timezone.now() + CLAIM_TIMEOUT)
+    return subscriptions
+
+
+@app.task
+def renew_due_subscriptions(chunk_size=500):
+    started = monotonic()
+    result = {
+        'processed': 0,
+        'charged': 0,
+        'failed': 0,
+        'errors': 0,
+        'unknown': 0,
+        'cancelled': 0
+    }
+    while True:
+        subscriptions = claim_due_subscriptions(chunk_size)
+        if not subscriptions:
+            break
+        claimed = len(subscriptions)
+        due = set(UserService.objects.filter(
+            pk__in=[subscription.pk for subscription in subscriptions],
+            is_active=True,
+            auto_pay=True
+        ).values_list('pk', flat=True))
+        subscriptions = [
+            subscription for subscription in subscriptions
+            if subscription.pk in due
+        ]
+        declined, errors, unknown = renew_subscriptions(subscriptions)
+        result['processed'] += claimed
+        result['cancelled'] += claimed - len(subscriptions)
+        UserService.objects.filter(pk__in=declined).update(
+            renew_at=timezone.now() + RETRY_DELAY
+        )
+        result['failed'] += len(declined)
+        result['errors'] += len(errors)
+        result['unknown'] += len(unknown)
+    result['charged'] = (
+        result['processed'] - result['failed'] - result['errors']
+        - result['unknown'] - result['cancelled']
+    )
+    result['elapsed'] = monotonic() - started
+    return result
+
+
+def renew_subscriptions(subscriptions):
+    conditions = get_user_conditions([
+        subscription for subscription in subscriptions
+        if not subscription.condition
+    ])
+    renewals = []
+    errors = []
     for subscription in subscriptions:
-        if subscription.end_date < datetime.now().date():
-            if UserTrialPeriod.objects.filter(
-                user=subscription.user,
-                service=subscription.service
-            ).exists()\
-                and UserTrialPeriod.objects.get(
-                    user=subscription.user,
-                    service=subscription.service
-                ).end_date == subscription.end_date\
-                and TariffSpecialCondition.objects.filter(
-                    tariff=subscription.tariff
-            ).exists():
-                price = subscription.tariff.tariff_special_condition.price
-                response = post(
-                    url,
-                    data={
-                        'user': subscription.user,
-                        'price': price
-                    }
-                )
-                if response.status_code != 200:
-                    raise PaymentError
-                subscription.is_active = False
-                subscription.save()
-                days = get_days(subscription.tariff.tariff_special_condition)
-                connect_special_condition(
-                    object=subscription.tariff,
-                    days=days,
-                    user=subscription.user,
-                    phone_number=subscription.phone_number
-                )
-            else:
-                response = post(
-                    url,
-                    data={
-                        'user': subscription.user,
-                        'price': subscription.tariff.tariff_condition.price
-                    }
-                )
-                if response.status_code != 200:
-                    raise PaymentError
-                subscription.is_active = False
-                subscription.save()
-                days = get_days(subscription.tariff.tariff_condition)
-                create_subscribe(
-                    object=subscription.tariff,
-                    days=days,
-                    user=subscription.user,
-                    phone_number=subscription.phone_number
+        kind, condition = get_next_condition(
+            subscription.tariff,
+            subscription.condition
+            or get_condition_kind(subscription, conditions)
+        )
+        if condition is None:
+            logger.error(
+                'У тарифа подписки %s нет условий продления',
+                subscription.pk
+            )
+            errors.append(subscription.pk)
+        else:
+            renewals.append((subscription, kind, condition))
+    charged = bank_client.payment_many(
+        (
+            subscription.user,
+            condition.price,
+            get_renewal_key(subscription)
+        )
+        for subscription, kind, condition in renewals
+    )
+    declined = []
+    unknown = []
+    for (subscription, kind, condition), success in zip(renewals, charged):
+        if success is None:
+            unknown.append(subscription.pk)
+            continue
+        if not success:
+            declined.append(subscription.pk)
+            continue
+        try:
+            renewed = renew_subscription(subscription, kind, condition)
+        except Exception:
+            logger.exception(
+                'Оплаченная подписка %s не продлена',
+                subscription.pk
+            )
+            renewed = False
+        if not renewed:
+            errors.append(subscription.pk)
+    return declined, errors, unknown
+
+
+@transaction.atomic
+def renew_subscription(subscription, kind, condition):
+    if not UserService.objects.filter(
+        pk=subscription.pk,
+        is_active=True,
+        auto_pay=True
+    ).update(is_active=False):
+        logger.warning(
+            'Подписка %s уже продлена или отключена',
+            subscription.pk
+        )
+        return False
+    update_subscribers_count(subscription.service, -1)
+    connect = (
+        connect_special_condition if kind == SPECIAL_CONDITION
+        else create_subscribe
+    )
+    connect(
+        object=subscription.tariff,
+        days=get_days(condition),
+        user=subscription.user,
+        phone_number=subscription.phone_number
+    )
+    return True
+
+
+def place_subscription_order(key=None, **fields):
+    if key is None:
+        order = SubscriptionOrder.objects.create(**fields)
+    else:
+        order, created = SubscriptionOrder.objects.get_or_create(
+            key=key,
+            defaults=fields
+        )
+        if not created and any(
+            getattr(order, name) != value for name, value in fields.items()
+        ):
+            raise IdempotencyKeyConflict()
+        if not created and order.status != FAILED:
+            return order
+        if not created:
+            order.status = PENDING
+            order.save(update_fields=('status', 'updated'))
+    transaction.on_commit(lambda: charge_subscription_order.delay(order.pk))
+    return order
+
+
+@app.task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+    acks_late=True
+)
+def charge_subscription_order(order_id):
+    with transaction.atomic():
+        order = SubscriptionOrder.objects.select_related(
+            'user',
+            'tariff__service'
+        ).select_for_update(of=('self', 'user')).filter(
+            pk=order_id,
+            status=PENDING
+        ).first()
+        if order is None:
+            return None
+        if is_duplicate_subscription(
+            order.user,
+            order.tariff,
+            order.phone_number,
+            resume=order.source_id is not None,
+            created_before=order.created
+        ):
+            order.status = FAILED
+            order.save(update_fields=('status', 'updated'))
+            return order.status
+        order.save(update_fields=('updated',))
+    plan = pay_subscription(
+        order.tariff,
+        order.user,
+        order.phone_number,
+        order.key,
+        trial=order.source_id is None
+    )
+    with transaction.atomic():
+        if not SubscriptionOrder.objects.select_for_update().filter(
+            pk=order.pk,
+            status=PENDING
+        ).exists():
+            return None
+        if plan is not None:
+            order.subscription = apply_subscription(
+                plan,
+                order.tariff,
+                order.user,
+                order.phone_number,
+                resume=order.source_id is not None
+            )
+        order.status = FAILED if order.subscription is None else SUCCEEDED
+        order.save(update_fields=('subscription', 'status', 'updated'))
+    return order.status
+
+
+@app.task
+def retry_subscription_orders():
+    order_ids = list(SubscriptionOrder.objects.filter(
+        status=PENDING,
+        updated__lt=timezone.now() - ORDER_RETRY_AFTER
+    ).values_list('pk', flat=True))
+    for order_id in order_ids:
+        charge_subscription_order.delay(order_id)
+    if order_ids:
+        logger.warning('Повторно поставлено заказов: %s', len(order_ids))
+    return len(order_ids)
+
+
+@app.task
+def reconcile_subscribers_count():
+    counts = dict(
+        UserService.objects.filter(
+            is_active=True,
+            auto_pay=True
+        ).values('service').annotate(
+            count=Count('id')
+        ).values_list('service', 'count')
+    )
+    services = []
+    for service in Service.objects.only('id', 'subscribers_count'):
+        count = counts.get(service.id, 0)
+        if service.subscribers_count != count:
+            service.subscribers_count = count
+            services.append(service)
+    Service.objects.bulk_update(services, ('subscribers_count',))
+
+
+def rebuild_monthly_expenses(user_ids):
+    with transaction.atomic():
+        rows = {
+            (row['user'], row['month'], row['category']): (
+                row['expense_sum'],
+                row['cashback_sum']
+            )
+            for row in UserService.objects.filter(
+                user__in=user_ids
+            ).values(
+                'user',
+                month=TruncMonth('start_date'),
+                category=F('service__category')
+            ).annotate(
+                expense_sum=Sum('expense'),
+                cashback_sum=Sum('cashback')
+            ).order_by()
+        }
+        current = {
+            (user, month, category): (expense, cashback)
+            for user, month, category, expense, cashback
+            in UserMonthlyExpense.objects.filter(
+                user__in=user_ids
+            ).values_list('user', 'month', 'category', 'expense', 'cashback')
+        }
+        changed = {
+            key[0] for key in rows.keys() | current.keys()
+            if rows.get(key) != current.get(key)
+        }
+        if not changed:
+            return 0
+        UserMonthlyExpense.objects.filter(user__in=changed).delete()
+        UserMonthlyExpense.objects.bulk_create(
+            UserMonthlyExpense(
+                user_id=user,
+                month=month,
+                category_id=category,
+                expense=expense,
+                cashback=cashback
+            )
+            for (user, month, category), (expense, cashback) in rows.items()
+            if user in changed
+        )
+        update_data_version(*changed)
+    return len(changed)
+
+
+@app.task
+def reconcile_monthly_expenses(batch_size=1000):
+    queryset = User.objects.order_by('pk').values_list('pk', flat=True)
+    updated = 0
+    batch = list(queryset[:batch_size])
+    while batch:
+        updated += rebuild_monthly_expenses(batch)
+        batch = list(queryset.filter(pk__gt=batch[-1])[:batch_size])
+    return updated
+
+
+@app.task
+def build_charge_projection(days=90):
+    today = datetime.now().date()
+    last_day = today + timedelta(days=days - 1)
+    tariffs = Tariff.objects.select_related(
+        'service',
+        'tariff_condition',
+        'tariff_special_condition'
+    ).in_bulk()
+    groups = UserService.objects.filter(
+        is_active=True,
+        auto_pay=True,
+        end_date__lt=last_day
+    ).values_list(
+        'tariff',
+        'condition',
+        Greatest(
+            'end_date',
+            Value(today - timedelta(days=1), output_field=DateField())
+        )
+    ).annotate(
+        renewals=Count('id')
+    ).order_by().iterator()
+    projection = defaultdict(lambda: [0, 0, 0])
+    for tariff_id, kind, end_date, renewals in groups:
+        tariff = tariffs[tariff_id]
+        for charge_date, kind, condition in get_charges(
+            tariff,
+            kind,
+            end_date + timedelta(days=1),
+            last_day
+        ):
+            totals = projection[charge_date, tariff.service]
+            totals[0] += renewals
+            totals[1] += condition.price * renewals
+            if kind == CONDITION:
+                totals[2] += floor(
+                    condition.price * (tariff.service.cashback or 0) / 100
+                ) * renewals
+    with transaction.atomic():
+        ChargeProjection.objects.all().delete()
+        ChargeProjection.objects.bulk_create(
+            (
+                ChargeProjection(
+                    date=charge_date,
+                    service=service,
+                    category_id=service.category_id,
+                    renewals=renewals,
+                    charges=charges,
+                    cashback=cashback
                 )
+                for (charge_date, service), (renewals, charges, cashback)
+                in projection.items()
+            ),
+            batch_size=1000
+        )
+    return len(projection)
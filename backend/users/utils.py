@@ -1,4 +1,6 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
 
 
 def get_full_url(path=None):
@@ -11,3 +13,9 @@ def get_full_url(path=None):
         return 'http://127.0.0.1:8000/'
     elif not settings.DEBUG and not path:
         return f'{url}'
+
+
+def update_data_version(*user_ids):
+    get_user_model().objects.filter(
+        pk__in=user_ids
+    ).update(data_version=F('data_version') + 1)